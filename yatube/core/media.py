@@ -0,0 +1,227 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+# Имена миниатюр sorl и картинок в хранилище по содержимому - хеши:
+# файл с таким именем никогда не меняется
+HASHED_NAME = re.compile(r'(?:^|/)[0-9a-f]{32,}\.\w+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Имена статики после ManifestStaticFilesStorage: name.<12 hex>.ext
+STATIC_HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Заранее сжатые копии в порядке предпочтения
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+PRECOMPRESSED_SUFFIXES = dict(PRECOMPRESSED)
+ENCODED_TYPES = {
+    'bzip2': 'application/x-bzip',
+    'gzip': 'application/gzip',
+    'xz': 'application/x-xz',
+}
+
+
+class RangeFile:
+    """Файл, из которого читается только диапазон [start, start + length)."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def content_type(path):
+    # Как в FileResponse: сжатые файлы отдаются как есть, без
+    # Content-Encoding, чтобы браузер их не распаковывал.
+    guessed, encoding = mimetypes.guess_type(path)
+    guessed = ENCODED_TYPES.get(encoding, guessed)
+    return guessed or 'application/octet-stream'
+
+
+def cache_control(path):
+    if HASHED_NAME.search(path):
+        return IMMUTABLE
+    return f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+
+def parse_range(header, size):
+    """(start, length) из заголовка Range с одним диапазоном.
+
+    None - заголовка нет или он не поддерживается (отдаётся весь файл),
+    ValueError - диапазон за пределами файла.
+    """
+    match = RANGE.match(header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        length = min(int(last), size)
+        if not length:
+            raise ValueError(header)
+        return size - length, length
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end - start + 1
+
+
+def if_range_matches(request, etag, last_modified):
+    value = request.META.get('HTTP_IF_RANGE')
+    if value is None:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def _accel_response(path, full_path):
+    # Заголовки - только ASCII: иначе Django закодирует их по RFC 2047,
+    # и прокси не найдёт файл. nginx и mod_xsendfile раскодируют %XX.
+    response = HttpResponse(content_type=content_type(path))
+    if settings.MEDIA_ACCEL == 'nginx':
+        response['X-Accel-Redirect'] = quote(
+            settings.MEDIA_ACCEL_PREFIX + path)
+    else:
+        response['X-Sendfile'] = quote(full_path)
+    return response
+
+
+def _stat(root, path):
+    try:
+        full_path = safe_join(root, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    return full_path, stat
+
+
+def _validators(stat):
+    return (quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}'),
+            int(stat.st_mtime))
+
+
+def _finish(response, etag, last_modified, cache):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache
+    return response
+
+
+@require_safe
+def serve(request, path):
+    """Отдаёт файл из MEDIA_ROOT с заголовками кеширования.
+
+    С MEDIA_ACCEL = 'nginx' или 'sendfile' приложение проверяет запрос
+    и заголовки, а байты отдаёт прокси (X-Accel-Redirect/X-Sendfile).
+    Иначе файл отдаёт FileResponse с поддержкой Range и условных
+    запросов. Миниатюры и картинки с хешем в имени кешируются навсегда.
+    """
+    full_path, stat = _stat(settings.MEDIA_ROOT, path)
+    etag, last_modified = _validators(stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if settings.MEDIA_ACCEL:
+            response = _accel_response(path, full_path)
+        else:
+            response = _file_response(request, full_path, stat.st_size,
+                                      etag, last_modified)
+    return _finish(response, etag, last_modified, cache_control(path))
+
+
+def accepts_encoding(request, encoding):
+    """Принимает ли клиент Content-Encoding encoding (с q > 0)."""
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.partition(';')
+        if name.strip().lower() != encoding:
+            continue
+        params = params.replace(' ', '')
+        if not params.startswith('q='):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+@require_safe
+def serve_static(request, path):
+    """Отдаёт собранную статику из STATIC_ROOT.
+
+    Если рядом с файлом лежит заранее сжатая копия (.br или .gz, см.
+    core.storage) и клиент её принимает, отдаётся она с Content-Encoding.
+    Файлы с хешем содержимого в имени кешируются навсегда.
+    """
+    full_path, stat = _stat(settings.STATIC_ROOT, path)
+    encoding = None
+    for candidate, suffix in PRECOMPRESSED:
+        if (accepts_encoding(request, candidate)
+                and os.path.isfile(full_path + suffix)):
+            encoding = candidate
+            stat = os.stat(full_path + suffix)
+            break
+    etag, last_modified = _validators(stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, full_path, stat.st_size,
+                                  etag, last_modified, encoding)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    if STATIC_HASHED_NAME.search(path):
+        cache = IMMUTABLE
+    else:
+        cache = f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    return _finish(response, etag, last_modified, cache)
+
+
+def _file_response(request, full_path, size, etag, last_modified,
+                   encoding=None):
+    byte_range = None
+    if if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    # Тип содержимого - по имени исходного файла, даже если отдаётся
+    # его сжатая копия.
+    file = open(full_path + PRECOMPRESSED_SUFFIXES.get(encoding, ''), 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type(full_path))
+        response['Content-Length'] = size
+    else:
+        start, length = byte_range
+        response = FileResponse(RangeFile(file, start, length),
+                                content_type=content_type(full_path),
+                                status=206)
+        response['Content-Range'] = (
+            f'bytes {start}-{start + length - 1}/{size}')
+        response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,155 @@
+import logging
+import time
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .media import accepts_encoding
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен: тогда сжимаем только gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Типы, которые уже сжаты или почти не сжимаются
+SKIP_TYPES = ('image/', 'video/', 'audio/', 'font/woff', 'application/zip',
+              'application/gzip', 'application/x-bzip', 'application/x-xz',
+              'application/octet-stream', 'application/pdf')
+
+
+class GzipCompressor:
+    encoding = 'gzip'
+
+    def __init__(self):
+        # wbits 16 + MAX_WBITS - формат gzip с заголовком и CRC.
+        self.stream = zlib.compressobj(
+            settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED,
+            16 + zlib.MAX_WBITS)
+
+    def process(self, data):
+        # SYNC_FLUSH отдаёт клиенту всё, что пришло, не дожидаясь конца.
+        return self.stream.compress(data) + self.stream.flush(
+            zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.stream.flush()
+
+
+class BrotliCompressor:
+    encoding = 'br'
+
+    def __init__(self):
+        self.stream = brotli.Compressor(
+            quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def process(self, data):
+        return self.stream.process(data) + self.stream.flush()
+
+    def finish(self):
+        return self.stream.finish()
+
+
+COMPRESSORS = [GzipCompressor]
+if brotli is not None:
+    COMPRESSORS.insert(0, BrotliCompressor)
+
+
+class Meter:
+    """Считает байты до и после сжатия и процессорное время на сжатие."""
+
+    def __init__(self, compressor):
+        self.compressor = compressor
+        self.raw = 0
+        self.compressed = 0
+        self.cpu = 0.0
+
+    def _timed(self, method, *args):
+        started = time.thread_time()
+        data = method(*args)
+        self.cpu += time.thread_time() - started
+        self.compressed += len(data)
+        return data
+
+    def process(self, data):
+        self.raw += len(data)
+        return self._timed(self.compressor.process, data)
+
+    def finish(self):
+        return self._timed(self.compressor.finish)
+
+    @property
+    def ratio(self):
+        return self.compressed / self.raw if self.raw else 1.0
+
+    def server_timing(self):
+        return (f'compress;dur={self.cpu * 1000:.2f};'
+                f'desc="{self.compressor.encoding} {self.ratio:.1%}"')
+
+    def log(self, request):
+        logger.debug(
+            '%s %s: %s %s -> %s байт (%.1f%%), CPU %.2f мс',
+            request.method, request.path, self.compressor.encoding,
+            self.raw, self.compressed, self.ratio * 100, self.cpu * 1000)
+
+
+def compress_stream(chunks, meter, request):
+    for chunk in chunks:
+        data = meter.process(chunk)
+        if data:
+            yield data
+    yield meter.finish()
+    meter.log(request)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Сжимает ответы brotli (если установлен) или gzip.
+
+    Работает и с обычными, и с потоковыми ответами: потоковые сжимаются
+    по частям без буферизации всего тела. Пропускает уже сжатые типы,
+    ответы с Content-Encoding, частичные ответы и тела короче
+    COMPRESSION_MIN_LENGTH. Уровень сжатия задаётся настройками
+    COMPRESSION_GZIP_LEVEL и COMPRESSION_BROTLI_QUALITY. Степень сжатия
+    и процессорное время попадают в заголовок Server-Timing (для
+    обычных ответов) и в отладочный лог core.middleware.
+    """
+
+    def process_response(self, request, response):
+        if response.status_code < 200 or response.status_code in (204, 206,
+                                                                  304):
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').startswith(SKIP_TYPES):
+            return response
+        if (not response.streaming
+                and len(response.content) < settings.COMPRESSION_MIN_LENGTH):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        for compressor_class in COMPRESSORS:
+            if accepts_encoding(request, compressor_class.encoding):
+                break
+        else:
+            return response
+        meter = Meter(compressor_class())
+        if response.streaming:
+            response.streaming_content = compress_stream(
+                response.streaming_content, meter, request)
+            del response['Content-Length']
+        else:
+            content = meter.process(response.content) + meter.finish()
+            meter.log(request)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+            response['Server-Timing'] = meter.server_timing()
+        # Сжатое тело отличается побайтно: сильный ETag становится слабым.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = compressor_class.encoding
+        return response
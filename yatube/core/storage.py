@@ -0,0 +1,57 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен: тогда пишется только gzip
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.xml',
+                '.map', '.ico')
+# Сжатая копия не пишется, если экономит меньше этой доли размера
+MIN_SAVING = 0.05
+
+
+def compress_gzip(data):
+    # mtime=0 - одинаковый результат при каждой сборке.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compress_brotli(data):
+    return brotli.compress(data, quality=11)
+
+
+COMPRESSORS = [('.gz', compress_gzip)]
+if brotli is not None:
+    COMPRESSORS.append(('.br', compress_brotli))
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хешем в имени и заранее сжатыми копиями.
+
+    collectstatic записывает файлы с хешем содержимого в имени (их можно
+    кешировать навсегда), манифест и рядом с текстовыми файлами -
+    .gz и, если установлен brotli, .br. Сжатие идёт один раз при сборке,
+    а не на каждый запрос; копию выбирает core.media.serve_static.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            if name.lower().endswith(COMPRESSIBLE):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as file:
+            data = file.read()
+        for suffix, compressor in COMPRESSORS:
+            compressed = compressor(data)
+            if len(compressed) > len(data) * (1 - MIN_SAVING):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
@@ -0,0 +1,197 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+
+from .middleware import CompressionMiddleware
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+HASHED = 'cache/ab/cd/' + 'ab' * 16 + '.jpg'
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, MEDIA_ACCEL=None)
+class MediaServingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ('posts/plain.jpg', HASHED, 'posts/фото 1.jpg'):
+            path = os.path.join(TEMP_MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(bytes(range(100)))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get(self, name, **headers):
+        return self.client.get(settings.MEDIA_URL + name, **headers)
+
+    def test_full_file(self):
+        response = self.get('posts/plain.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content),
+                         bytes(range(100)))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'],
+                         f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}')
+
+    def test_hashed_file_is_immutable(self):
+        response = self.get(HASHED)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_range_requests(self):
+        response = self.get('posts/plain.jpg', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(response.streaming_content),
+                         bytes(range(10, 20)))
+        response = self.get('posts/plain.jpg', HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content),
+                         bytes(range(95, 100)))
+        response = self.get('posts/plain.jpg', HTTP_RANGE='bytes=200-')
+        self.assertEqual(response.status_code, 416)
+        response = self.get('posts/plain.jpg', HTTP_RANGE='bytes=0-1',
+                            HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get(self):
+        etag = self.get('posts/plain.jpg')['ETag']
+        response = self.get('posts/plain.jpg', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        last_modified = self.get(HASHED)['Last-Modified']
+        response = self.get(HASHED, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.get('posts/missing.jpg').status_code, 404)
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+        self.assertEqual(self.get('posts').status_code, 404)
+
+    @override_settings(MEDIA_ACCEL='nginx')
+    def test_x_accel_redirect(self):
+        response = self.get('posts/plain.jpg')
+        self.assertEqual(response['X-Accel-Redirect'],
+                         settings.MEDIA_ACCEL_PREFIX + 'posts/plain.jpg')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    @override_settings(MEDIA_ACCEL='sendfile')
+    def test_x_sendfile(self):
+        response = self.get('posts/plain.jpg')
+        self.assertEqual(response['X-Sendfile'], os.path.join(
+            TEMP_MEDIA_ROOT, 'posts', 'plain.jpg'))
+
+    def test_accel_headers_are_percent_encoded(self):
+        with self.settings(MEDIA_ACCEL='nginx'):
+            response = self.get('posts/фото 1.jpg')
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            settings.MEDIA_ACCEL_PREFIX
+            + 'posts/%D1%84%D0%BE%D1%82%D0%BE%201.jpg')
+        with self.settings(MEDIA_ACCEL='sendfile'):
+            response = self.get('posts/фото 1.jpg')
+        self.assertEqual(response['X-Sendfile'], quote(os.path.join(
+            TEMP_MEDIA_ROOT, 'posts', 'фото 1.jpg')))
+        self.assertTrue(response['X-Sendfile'].isascii())
+
+
+@override_settings(
+    STATIC_ROOT=os.path.join(TEMP_MEDIA_ROOT, 'collected'),
+    STATICFILES_DIRS=[os.path.join(TEMP_MEDIA_ROOT, 'source')],
+    STATICFILES_STORAGE='core.storage.CompressedManifestStaticFilesStorage')
+class StaticPipelineTest(TestCase):
+    CSS = b'body { color: #333; }\n' * 100
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        source = os.path.join(TEMP_MEDIA_ROOT, 'source', 'css')
+        os.makedirs(source, exist_ok=True)
+        with open(os.path.join(source, 'site.css'), 'wb') as file:
+            file.write(cls.CSS)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(settings.STATIC_ROOT,
+                               'staticfiles.json')) as file:
+            cls.hashed = json.load(file)['paths']['css/site.css']
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get(self, name, **headers):
+        return self.client.get(settings.STATIC_URL + name, **headers)
+
+    def test_collectstatic_writes_hashed_gzip_copy(self):
+        self.assertRegex(self.hashed, r'^css/site\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(settings.STATIC_ROOT,
+                               self.hashed + '.gz'), 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), self.CSS)
+
+    def test_precompressed_variant_served(self):
+        response = self.get(self.hashed, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)), self.CSS)
+
+    def test_identity_without_accept_encoding(self):
+        response = self.get(self.hashed)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), self.CSS)
+        response = self.get('css/site.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+
+class CompressionMiddlewareTest(SimpleTestCase):
+    BODY = '<p>Пост о котиках</p>\n' * 200
+
+    def process(self, response, accept='gzip'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept)
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(request)
+
+    def test_gzip_response(self):
+        response = self.process(HttpResponse(self.BODY))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('compress;dur=', response['Server-Timing'])
+        self.assertEqual(gzip.decompress(response.content).decode(),
+                         self.BODY)
+
+    def test_streaming_response(self):
+        chunks = (self.BODY.encode() for _ in range(5))
+        response = self.process(StreamingHttpResponse(chunks))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            self.BODY.encode() * 5)
+
+    def test_weak_etag(self):
+        response = HttpResponse(self.BODY)
+        response['ETag'] = '"abc"'
+        self.assertEqual(self.process(response)['ETag'], 'W/"abc"')
+
+    def test_skipped_responses(self):
+        self.assertFalse(self.process(HttpResponse('короткий')).has_header(
+            'Content-Encoding'))
+        image = HttpResponse(b'\0' * 5000, content_type='image/png')
+        self.assertFalse(self.process(image).has_header('Content-Encoding'))
+        response = self.process(HttpResponse(self.BODY), accept='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
@@ -1,5 +1,7 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 
+from . import search
 from .models import Post, Group
 
 
@@ -10,6 +12,16 @@ class PostAdmin(admin.ModelAdmin):
     list_editable = ('group',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        match = search.match_expression(search_term)
+        if not match or not search.fts_enabled():
+            return super().get_search_results(
+                request, queryset, search_term)
+        # Вместо LIKE '%...%' по всей таблице ищем по индексу FTS5.
+        ids = RawSQL(f'SELECT rowid FROM {search.FTS_TABLE} '
+                     f'WHERE {search.FTS_TABLE} MATCH %s', [match])
+        return queryset.filter(pk__in=ids), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description')
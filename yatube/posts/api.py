@@ -0,0 +1,155 @@
+import json
+from functools import wraps
+
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_POST, require_safe
+
+from . import bulk, conditional, timeline
+from .conditional import conditional_page
+from .models import Comment, Group, Post, User
+from .serializers import BadRequest, CommentSerializer, PostSerializer
+from .utils import CURSOR_PARAM, POSTS_PER_PAGE, CursorPaginator
+
+MAX_LIMIT = 100
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, safe=False,
+                        json_dumps_params=JSON_PARAMS)
+
+
+def api_view(view):
+    """GET-представление API: ошибки тоже отдаются в JSON.
+
+    BadRequest (неизвестное поле в ?fields=, неверный limit) - это 400.
+    """
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Http404:
+            return _json({'detail': 'Не найдено'}, status=404)
+        except BadRequest as error:
+            return _json({'detail': str(error)}, status=400)
+    return wrapper
+
+
+def bulk_view(create):
+    """POST-представление пакетной записи: тело - JSON-массив объектов.
+
+    Ответ - результат для каждого элемента в порядке запроса; элементы
+    с ошибками не мешают сохранить остальные.
+    """
+    @require_POST
+    @wraps(create)
+    def wrapper(request):
+        if not request.user.is_authenticated:
+            return _json({'detail': 'Требуется авторизация'}, status=401)
+        try:
+            items = json.loads(request.body)
+        except ValueError:
+            return _json({'detail': 'Тело запроса - не JSON'}, status=400)
+        if not isinstance(items, list):
+            return _json({'detail': 'Ожидается массив'}, status=400)
+        if len(items) > bulk.MAX_ITEMS:
+            return _json({'detail': f'Не больше {bulk.MAX_ITEMS} элементов '
+                                    f'за запрос'}, status=400)
+        results = create(request.user, items)
+        for index, result in enumerate(results):
+            result['index'] = index
+        return _json({'results': results})
+    return wrapper
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', POSTS_PER_PAGE))
+    except ValueError:
+        raise BadRequest('limit должен быть числом')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _page_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params[CURSOR_PARAM] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+def _page_response(request, page_obj, serializer):
+    return _json({
+        'results': serializer.dump(list(page_obj)),
+        'next': _page_url(request, page_obj.next_cursor),
+        'previous': _page_url(request, page_obj.previous_cursor),
+    })
+
+
+def _feed(request, queryset):
+    serializer = PostSerializer.from_request(request)
+    paginator = CursorPaginator(serializer.values(queryset), _limit(request),
+                                key='id')
+    page_obj = paginator.get_page(request.GET.get(CURSOR_PARAM))
+    return _page_response(request, page_obj, serializer)
+
+
+@api_view
+@conditional_page(conditional.index_scope)
+def index(request):
+    return _feed(request, Post.objects.all())
+
+
+@api_view
+@conditional_page(conditional.group_scope)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return _feed(request, Post.objects.filter(group=group))
+
+
+@api_view
+@conditional_page(conditional.profile_scope)
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return _feed(request, Post.objects.filter(author=author))
+
+
+@api_view
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return _json({'detail': 'Требуется авторизация'}, status=401)
+    serializer = PostSerializer.from_request(request)
+    page_obj = timeline.follow_cursor_page(
+        request.user, request.GET.get(CURSOR_PARAM), _limit(request))
+    return _page_response(request, page_obj, serializer)
+
+
+@api_view
+@conditional_page(conditional.post_scope)
+def post_detail(request, post_id):
+    serializer = PostSerializer.from_request(request)
+    row = serializer.values(Post.objects.filter(pk=post_id)).first()
+    if row is None:
+        raise Http404
+    return _json(serializer.dump([row])[0])
+
+
+@api_view
+@conditional_page(conditional.post_scope)
+def comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    serializer = CommentSerializer.from_request(request)
+    paginator = CursorPaginator(
+        serializer.values(Comment.objects.filter(post_id=post_id)),
+        _limit(request), field='created', key='id',
+        descending=request.GET.get('order') == 'newest')
+    page_obj = paginator.get_page(request.GET.get(CURSOR_PARAM))
+    return _page_response(request, page_obj, serializer)
+
+
+bulk_posts = bulk_view(bulk.create_posts)
+bulk_comments = bulk_view(bulk.create_comments)
+bulk_follows = bulk_view(bulk.create_follows)
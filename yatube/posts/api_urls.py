@@ -0,0 +1,17 @@
+from django.urls import path
+
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', api.index, name='index'),
+    path('groups/<slug:slug>/posts/', api.group_posts, name='group_posts'),
+    path('profiles/<str:username>/posts/', api.profile, name='profile'),
+    path('follow/', api.follow_index, name='follow_index'),
+    path('posts/bulk/', api.bulk_posts, name='bulk_posts'),
+    path('comments/bulk/', api.bulk_comments, name='bulk_comments'),
+    path('follows/bulk/', api.bulk_follows, name='bulk_follows'),
+    path('posts/<int:post_id>/', api.post_detail, name='post_detail'),
+    path('posts/<int:post_id>/comments/', api.comments, name='comments'),
+]
@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from .models import ImageBlob, Post
+
+
+def _tracked(name, storage):
+    return getattr(storage, 'is_hashed', lambda name: False)(name)
+
+
+def acquire(name, storage):
+    """Учитывает новую ссылку поста на файл name."""
+    if not _tracked(name, storage):
+        return
+    blob, created = ImageBlob.objects.get_or_create(
+        name=name, defaults={'refs': 1})
+    if not created:
+        ImageBlob.objects.filter(name=name).update(refs=F('refs') + 1)
+
+
+def release(name, storage):
+    """Снимает ссылку на файл; последний удаляет файл и его миниатюры.
+
+    Файлы, имена которых не хеши содержимого (загруженные до появления
+    ContentAddressedStorage или заданные вручную), не трогаются.
+    """
+    if not _tracked(name, storage):
+        return
+    if not ImageBlob.objects.filter(name=name).update(
+            refs=Greatest(F('refs') - 1, 0)):
+        return
+    transaction.on_commit(lambda: collect(name, storage))
+
+
+def collect(name, storage):
+    """Удаляет файл, если на него больше никто не ссылается."""
+    # Между release и фиксацией транзакции тот же файл мог быть загружен
+    # снова, поэтому ссылки проверяются ещё раз.
+    if Post.objects.filter(image=name).exists():
+        return
+    if not ImageBlob.objects.filter(name=name, refs=0).delete()[0]:
+        return
+    delete_thumbnails(ImageFile(name, storage), delete_file=False)
+    storage.delete(name)
@@ -0,0 +1,216 @@
+from contextlib import contextmanager
+
+from django.db import IntegrityError, connection, transaction
+
+from . import caching, counters, search, timeline
+from .forms import BulkPostForm, CommentForm
+from .models import Comment, Follow, Group, Post, User
+
+MAX_ITEMS = 500
+BATCH_SIZE = 500
+
+
+def insert(model, objs):
+    """bulk_create, после которого у всех объектов заполнен id.
+
+    Объекты с уже заданным id вставляются как есть. Вызывается внутри
+    транзакции. SQLite в Django 2.2 не возвращает id
+    из пакетного INSERT, но транзакция держит блокировку записи на всю
+    базу, поэтому вставленные строки - это последние len(objs) id.
+    На других базах без RETURNING объекты сохраняются по одному
+    (raw-сохранение: сигналы моделей не выполняют побочных действий).
+    """
+    # Объекты с заданным id вставляются первыми: тогда новые id
+    # остальных гарантированно больше всех существующих.
+    with_pk = [obj for obj in objs if obj.pk is not None]
+    if with_pk:
+        model.objects.bulk_create(with_pk, batch_size=BATCH_SIZE)
+    new = [obj for obj in objs if obj.pk is None]
+    if not new:
+        return objs
+    if connection.features.can_return_ids_from_bulk_insert:
+        model.objects.bulk_create(new, batch_size=BATCH_SIZE)
+    elif connection.vendor == 'sqlite':
+        model.objects.bulk_create(new, batch_size=BATCH_SIZE)
+        pks = model.objects.order_by('-pk').values_list(
+            'pk', flat=True)[:len(new)]
+        for obj, pk in zip(new, reversed(list(pks))):
+            obj.pk = pk
+    else:
+        for obj in new:
+            for field in model._meta.concrete_fields:
+                field.pre_save(obj, add=True)
+            obj.save_base(raw=True)
+    return objs
+
+
+@contextmanager
+def preserve_dates(model):
+    """Отключает auto_now и auto_now_add у полей модели.
+
+    Нужно импорту: даты переносимых записей сохраняются как есть.
+    Меняет поля на уровне процесса, поэтому только для команд.
+    """
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False)
+              or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add)
+             for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _invalid(errors):
+    return {'status': 'invalid', 'errors': errors}
+
+
+def _items(items):
+    # Каждый элемент - объект JSON; остальное сразу помечается ошибкой.
+    for item in items:
+        yield item if isinstance(item, dict) else None
+
+
+def _scalar(item, key):
+    # Ссылки (группа, пост, автор) - строка или число. Списки и объекты
+    # JSON не годятся даже как ключ поиска и считаются ошибкой элемента.
+    value = item.get(key) if item else None
+    if isinstance(value, (str, int)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _lookup(items, key):
+    return {_scalar(item, key) for item in _items(items)} - {None}
+
+
+def create_posts(user, items):
+    """Создаёт посты пользователя из списка словарей {text, group}.
+
+    Каждый элемент проверяется по правилам PostForm, корректные
+    вставляются пачкой в одной транзакции. Побочные действия сигналов
+    (счётчики, ленты подписчиков, поисковый индекс, кеши) выполняются
+    один раз на пачку. Возвращает результат для каждого элемента.
+    """
+    group_ids = _lookup(items, 'group')
+    groups = list(Group.objects.filter(pk__in=[
+        pk for pk in group_ids if str(pk).isdigit()]))
+    results, posts = [], []
+    for item in _items(items):
+        if item is None:
+            results.append(_invalid({'__all__': ['Ожидается объект']}))
+            continue
+        form = BulkPostForm(item, groups=groups)
+        valid = form.is_valid()
+        if item.get('group') is not None and _scalar(item, 'group') is None:
+            # Пустой список или объект форма приняла бы за «без группы».
+            form.add_error('group', 'Ожидается id группы')
+            valid = False
+        if not valid:
+            results.append(_invalid(form.errors.get_json_data()))
+            continue
+        post = form.save(commit=False)
+        post.author = user
+        posts.append(post)
+        results.append(post)
+    with transaction.atomic():
+        insert(Post, posts)
+        counters.posts_created(posts)
+        timeline.fan_out_posts(posts)
+        search.index_new_posts(posts)
+    if posts:
+        caching.bump_feed_generation()
+        tags = {'index'}
+        for post in posts:
+            tags.update(caching.post_tags(post))
+        caching.purge_tags(*tags)
+    return [_created(result) for result in results]
+
+
+def _created(result):
+    if isinstance(result, dict):
+        return result
+    return {'status': 'created', 'id': result.pk}
+
+
+def create_comments(user, items):
+    """Создаёт комментарии пользователя из словарей {post, text}."""
+    post_ids = _lookup(items, 'post')
+    existing = set(Post.objects.filter(pk__in=[
+        pk for pk in post_ids if str(pk).isdigit()]).values_list(
+        'pk', flat=True))
+    results, comments = [], []
+    for item in _items(items):
+        if item is None:
+            results.append(_invalid({'__all__': ['Ожидается объект']}))
+            continue
+        form = CommentForm(item)
+        valid = form.is_valid()
+        post_id = _scalar(item, 'post')
+        if not str(post_id).isdigit() or int(post_id) not in existing:
+            form.add_error(None, 'Пост не найден')
+            valid = False
+        if not valid:
+            results.append(_invalid(form.errors.get_json_data()))
+            continue
+        comment = form.save(commit=False)
+        comment.author = user
+        comment.post_id = int(post_id)
+        comments.append(comment)
+        results.append(comment)
+    with transaction.atomic():
+        insert(Comment, comments)
+        counters.comments_created(comments)
+    if comments:
+        caching.purge_tags(*{f'post:{comment.post_id}'
+                             for comment in comments})
+    return [_created(result) for result in results]
+
+
+def create_follows(user, items):
+    """Подписывает пользователя на авторов из словарей {author: username}.
+
+    Для уже существующей подписки элемент получает статус exists.
+    """
+    try:
+        return _create_follows(user, items)
+    except IntegrityError:
+        # Параллельный запрос успел оформить одну из подписок, и вся
+        # пачка откатилась. Повторная проверка пометит её как exists,
+        # а счётчики увеличатся только на реально вставленные строки.
+        return _create_follows(user, items)
+
+
+def _create_follows(user, items):
+    usernames = _lookup(items, 'author')
+    authors = {author.username: author for author in User.objects.filter(
+        username__in=[name for name in usernames if isinstance(name, str)])}
+    followed = set(Follow.objects.filter(
+        user=user, author__in=authors.values()).values_list(
+        'author_id', flat=True))
+    results, follows = [], []
+    for item in _items(items):
+        author = authors.get(_scalar(item, 'author'))
+        if author is None:
+            results.append(_invalid({'author': ['Автор не найден']}))
+        elif author == user:
+            results.append(_invalid({'author': ['Нельзя подписаться '
+                                                'на себя']}))
+        elif author.pk in followed:
+            results.append({'status': 'exists'})
+        else:
+            followed.add(author.pk)
+            follows.append(Follow(user=user, author=author))
+            results.append({'status': 'created'})
+    with transaction.atomic():
+        Follow.objects.bulk_create(follows)
+        counters.follows_created(follows)
+        timeline.add_follows(follows)
+    if follows:
+        caching.purge_tags(f'author:{user.pk}', *{
+            f'author:{follow.author_id}' for follow in follows})
+    return results
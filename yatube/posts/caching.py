@@ -0,0 +1,164 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+FEED_GENERATION_KEY = 'posts:feed_generation'
+
+
+def _initial_generation():
+    # Начинаем со времени, а не с единицы: если счётчик вытеснят из кеша,
+    # новое значение не совпадёт ни с одним из уже закешированных ключей.
+    return int(time.time() * 1000)
+
+
+def feed_generation():
+    """Текущее поколение лент; меняется при любом изменении постов."""
+    generation = cache.get(FEED_GENERATION_KEY)
+    if generation is None:
+        cache.add(FEED_GENERATION_KEY, _initial_generation(), None)
+        generation = cache.get(FEED_GENERATION_KEY)
+    return generation
+
+
+def bump_feed_generation():
+    """Инвалидирует все закешированные фрагменты лент во всех процессах.
+
+    Счётчик хранится в общем кеше (settings.CACHES).
+    """
+    try:
+        cache.incr(FEED_GENERATION_KEY)
+    except ValueError:
+        cache.set(FEED_GENERATION_KEY, _initial_generation(), None)
+
+
+def feed_cache_key(feed, request, page_obj, generation):
+    """Ключ фрагмента ленты: лента, поколение и страница или курсор.
+
+    generation читается до выборки постов страницы: иначе пост,
+    добавленный во время рендера, оказался бы вне фрагмента, сохранённого
+    под уже новым поколением.
+    """
+    if getattr(page_obj, 'is_cursor', False):
+        page = 'c' + request.GET.get('cursor', '')
+    else:
+        page = f'p{page_obj.number}'
+    return f'{feed}:{generation}:{page}'
+
+
+def _tag_key(tag):
+    return f'tag:{tag}'
+
+
+def tag_versions(tags, create=False):
+    """Текущие версии тегов; create=True заводит недостающие."""
+    keys = {tag: _tag_key(tag) for tag in tags}
+    stored = cache.get_many(list(keys.values()))
+    versions = {tag: stored.get(key) for tag, key in keys.items()}
+    if create:
+        for tag, version in versions.items():
+            if version is None:
+                cache.add(keys[tag], _initial_generation(), None)
+                versions[tag] = cache.get(keys[tag])
+    return versions
+
+
+def snapshot_versions(request, tags):
+    """Версии тегов страницы, прочитанные при первом обращении за запрос.
+
+    Версии запоминаются до того, как представление прочитает данные:
+    сброс, пришедший во время рендера, не даст сохранить устаревшую
+    страницу под новыми версиями.
+    """
+    if not hasattr(request, 'cache_versions'):
+        request.cache_versions = {}
+    versions = request.cache_versions
+    missing = [tag for tag in tags if tag not in versions]
+    if missing:
+        versions.update(tag_versions(missing, create=True))
+    return {tag: versions[tag] for tag in tags}
+
+
+def tag_page(request, tags):
+    """Помечает страницу тегами для cache_anonymous."""
+    request.cache_tags = list(tags)
+    snapshot_versions(request, request.cache_tags)
+
+
+def purge_tags(*tags):
+    """Сбрасывает все закешированные страницы с указанными тегами.
+
+    Версии тегов лежат в общем кеше, поэтому сброс из команды manage.py
+    или другого воркера виден всем процессам.
+    """
+    for tag in set(tags):
+        try:
+            cache.incr(_tag_key(tag))
+        except ValueError:
+            # Версии нет - значит, и страниц с этим тегом в кеше нет.
+            pass
+
+
+def post_tags(post, *extra_group_ids):
+    """Теги страниц, на которых виден пост."""
+    tags = [f'post:{post.pk}', f'author:{post.author_id}']
+    tags += [f'group:{group_id}'
+             for group_id in (post.group_id, *extra_group_ids)
+             if group_id is not None]
+    return tags
+
+
+def _is_anonymous(request):
+    # Проверяем cookie, а не request.user: так кеш не трогает сессии в БД.
+    return settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+
+def cache_anonymous(view):
+    """Кеширует страницу целиком для анонимных GET-запросов.
+
+    Представление помечает ответ тегами через tag_page до чтения
+    данных; страница считается актуальной, пока версии всех её тегов (и
+    общего тега 'site') не изменились. Вместе со страницей хранятся её ETag и
+    Last-Modified, так что попадание, в том числе ответ 304, обходится
+    без обращений к ORM.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not _is_anonymous(
+                request):
+            return view(request, *args, **kwargs)
+        key = 'page:' + hashlib.md5(
+            request.get_full_path().encode()).hexdigest()
+        entry = cache.get(key)
+        if entry is not None:
+            content, content_type, validators, versions = entry
+            if tag_versions(versions) == versions:
+                response = HttpResponse(content, content_type=content_type)
+                for header, value in validators.items():
+                    response[header] = value
+                response['X-Page-Cache'] = 'hit'
+                last_modified = parse_http_date_safe(
+                    validators.get('Last-Modified', ''))
+                return get_conditional_response(
+                    request, etag=validators.get('ETag'),
+                    last_modified=last_modified, response=response)
+        snapshot_versions(request, ['site'])
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            tags = ['site', *getattr(request, 'cache_tags', ())]
+            validators = {header: response[header]
+                          for header in ('ETag', 'Last-Modified')
+                          if response.has_header(header)}
+            cache.set(key, (response.content, response['Content-Type'],
+                            validators, snapshot_versions(request, tags)),
+                      settings.ANONYMOUS_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'miss'
+        return response
+    return wrapper
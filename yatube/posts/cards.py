@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template import Context
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from . import caching, thumbnails
+
+CARD_TEMPLATE = 'includes/post_card.html'
+
+
+def group_card_tag(group_id):
+    """Тег карточек постов группы: сбрасывается при правке группы."""
+    return f'group_card:{group_id}'
+
+
+def author_card_tag(author_id):
+    """Тег карточек постов автора: сбрасывается при смене его имени."""
+    return f'author_card:{author_id}'
+
+
+def card_versions(posts):
+    """Версии тегов авторов и групп постов, одним запросом к кешу."""
+    tags = {author_card_tag(post.author_id) for post in posts}
+    tags |= {group_card_tag(post.group_id) for post in posts if post.group_id}
+    return caching.tag_versions(tags, create=True)
+
+
+def card_key(post, versions=None):
+    """Ключ карточки: id поста, момент его изменения, версии автора и группы.
+
+    Карточка содержит имя автора, ссылку на его профиль, название и
+    адрес группы, поэтому их правка тоже даёт новый ключ, и посты при
+    этом не обновляются.
+    """
+    if versions is None:
+        versions = card_versions([post])
+    author = versions[author_card_tag(post.author_id)]
+    group = versions[group_card_tag(post.group_id)] if post.group_id else ''
+    return (f'post_card:{post.pk}:{post.updated.timestamp()}:'
+            f'{author}:{group}')
+
+
+def render_card_html(posts):
+    """html карточек постов, отрендеренных одним шаблоном за один проход.
+
+    Шаблон карточки загружается один раз, а все карточки рендерятся в
+    общем Context: шаблоны {% include %} внутри карточки разрешаются
+    один раз на страницу, а не на каждый пост.
+    """
+    template = get_template(CARD_TEMPLATE).template
+    context = Context()
+    rendered = []
+    for post in posts:
+        with context.push(post=post):
+            rendered.append(template.render(context))
+    return rendered
+
+
+def render_cards(posts):
+    """Возвращает пары (пост, html карточки) для страницы ленты.
+
+    Все карточки запрашиваются из кеша одним get_many, рендерятся
+    только промахи (с одним пакетным поиском миниатюр), и они же
+    записываются одним set_many.
+    """
+    posts = list(posts)
+    versions = card_versions(posts)
+    keys = {post.pk: card_key(post, versions) for post in posts}
+    cached = cache.get_many(list(keys.values()))
+    missing = [post for post in posts if keys[post.pk] not in cached]
+    rendered = {}
+    if missing:
+        # Миниатюры нужны только перерисовываемым карточкам.
+        thumbnails.prefetch(missing)
+        rendered = {keys[post.pk]: html for post, html in zip(
+            missing, render_card_html(missing))}
+    cards = []
+    for post in posts:
+        key = keys[post.pk]
+        html = cached.get(key) or rendered[key]
+        cards.append((post, mark_safe(html)))
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+    return cards
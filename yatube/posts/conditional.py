@@ -0,0 +1,97 @@
+import hashlib
+
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from .caching import snapshot_versions
+from .models import Comment, Group, Post, User
+
+
+def _newest(queryset, field='pub_date'):
+    return queryset.order_by(f'-{field}').values_list(
+        field, flat=True).first()
+
+
+def index_scope(request):
+    return ['index'], _newest(Post.objects.all())
+
+
+def group_scope(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        return None
+    return ([f'group:{group_id}'],
+            _newest(Post.objects.filter(group_id=group_id)))
+
+
+def profile_scope(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return None
+    return ([f'author:{author_id}'],
+            _newest(Post.objects.filter(author_id=author_id)))
+
+
+def post_scope(request, post_id):
+    row = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id', 'updated').first()
+    if row is None:
+        return None
+    author_id, group_id, updated = row
+    tags = [f'post:{post_id}', f'author:{author_id}']
+    if group_id is not None:
+        tags.append(f'group:{group_id}')
+    commented = _newest(Comment.objects.filter(post_id=post_id), 'created')
+    return tags, max(filter(None, (updated, commented)))
+
+
+def page_scope(request, scope_func, *args, **kwargs):
+    """Теги и дата изменения страницы; считаются один раз на запрос."""
+    if not hasattr(request, '_conditional_scope'):
+        request._conditional_scope = scope_func(request, *args, **kwargs)
+    return request._conditional_scope
+
+
+def conditional_page(scope_func):
+    """Отвечает 304 Not Modified, если страница не менялась.
+
+    scope_func возвращает теги страницы и дату её последнего изменения,
+    прочитанную по индексу. ETag строится из этой даты, версий тегов
+    (они меняются и при правке, и при удалении постов), пользователя,
+    для которого страница отрисована, и его CSRF-токена, поэтому
+    страница не рендерится для проверки. Версии тегов хранятся в общем
+    кеше (settings.CACHES), иначе сброс в одном процессе не виден
+    остальным.
+    """
+    def scope(request, *args, **kwargs):
+        return page_scope(request, scope_func, *args, **kwargs)
+
+    def etag(request, *args, **kwargs):
+        page_scope = scope(request, *args, **kwargs)
+        if page_scope is None:
+            return None
+        tags = ['site', *page_scope[0]]
+        versions = snapshot_versions(request, tags)
+        # Дата из БД тоже входит в ETag: если версии тегов в кеше
+        # отстали от записи, ответ всё равно не будет 304 для старой
+        # страницы.
+        modified = page_scope[1].isoformat() if page_scope[1] else ''
+        # Страницы авторизованного пользователя содержат формы с
+        # CSRF-токеном, который меняется при входе: старая страница со
+        # старым токеном не должна получить 304.
+        csrf = ''
+        if request.user.is_authenticated:
+            # get_token заводит токен, если его ещё нет, - тот же, что
+            # попадёт в формы страницы.
+            get_token(request)
+            csrf = request.META['CSRF_COOKIE']
+        raw = '|'.join([str(request.user.pk), csrf, modified] + [
+            f'{tag}={versions[tag]}' for tag in tags])
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    # Last-Modified не отдаётся: правка или удаление постов и
+    # комментариев не сдвигают дату из scope_func вперёд, и проверка
+    # по If-Modified-Since вернула бы 304 для устаревшей страницы.
+    return condition(etag_func=etag)
@@ -0,0 +1,125 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Follow, Group, Post, UserStats
+
+
+def _deltas(**deltas):
+    return {
+        field: (F(field) + delta if delta > 0
+                else Greatest(F(field) + delta, 0))
+        for field, delta in deltas.items()
+    }
+
+
+def bump(model, pk, **deltas):
+    """Атомарно изменяет счётчики строки model с первичным ключом pk."""
+    if pk is not None:
+        model.objects.filter(pk=pk).update(**_deltas(**deltas))
+
+
+def bump_user(user_id, **deltas):
+    """Изменяет счётчики пользователя, создавая строку при её отсутствии."""
+    if UserStats.objects.filter(pk=user_id).update(**_deltas(**deltas)):
+        return
+    # Строки нет только у пользователей, созданных до появления счётчиков
+    # или в обход сигналов; уменьшать в этом случае нечего.
+    if all(delta > 0 for delta in deltas.values()):
+        recount_user(user_id)
+
+
+def user_counts(user_ids):
+    """Фактические значения счётчиков для набора пользователей."""
+    counts = {user_id: dict.fromkeys(
+        ('posts_count', 'followers_count', 'following_count'), 0)
+        for user_id in user_ids}
+    queries = (
+        ('posts_count', Post.objects, 'author_id'),
+        ('followers_count', Follow.objects, 'author_id'),
+        ('following_count', Follow.objects, 'user_id'),
+    )
+    for field, manager, column in queries:
+        rows = manager.filter(**{f'{column}__in': user_ids}).order_by(
+        ).values(column).annotate(total=Count('pk')).values_list(
+            column, 'total')
+        for user_id, total in rows:
+            counts[user_id][field] = total
+    return counts
+
+
+def recount_user(user_id):
+    values = user_counts([user_id])[user_id]
+    UserStats.objects.update_or_create(user_id=user_id, defaults=values)
+
+
+def post_created(post):
+    with transaction.atomic():
+        bump_user(post.author_id, posts_count=1)
+        bump(Group, post.group_id, posts_count=1)
+
+
+def post_group_changed(old_group_id, new_group_id):
+    with transaction.atomic():
+        bump(Group, old_group_id, posts_count=-1)
+        bump(Group, new_group_id, posts_count=1)
+
+
+def post_deleted(post):
+    with transaction.atomic():
+        bump_user(post.author_id, posts_count=-1)
+        bump(Group, post.group_id, posts_count=-1)
+
+
+def comment_created(comment):
+    bump(Post, comment.post_id, comments_count=1)
+
+
+def comment_deleted(comment):
+    bump(Post, comment.post_id, comments_count=-1)
+
+
+def follow_created(follow):
+    with transaction.atomic():
+        bump_user(follow.author_id, followers_count=1)
+        bump_user(follow.user_id, following_count=1)
+
+
+def follow_deleted(follow):
+    with transaction.atomic():
+        bump_user(follow.author_id, followers_count=-1)
+        bump_user(follow.user_id, following_count=-1)
+
+
+def _bump_grouped(model, ids, field):
+    for pk, total in Counter(ids).items():
+        bump(model, pk, **{field: total})
+
+
+def _bump_users_grouped(ids, field):
+    for pk, total in Counter(ids).items():
+        bump_user(pk, **{field: total})
+
+
+def posts_created(posts):
+    """post_created для пачки постов: по одному UPDATE на строку счётчика."""
+    with transaction.atomic():
+        _bump_users_grouped([post.author_id for post in posts],
+                            'posts_count')
+        _bump_grouped(Group, [post.group_id for post in posts
+                              if post.group_id is not None], 'posts_count')
+
+
+def comments_created(comments):
+    _bump_grouped(Post, [comment.post_id for comment in comments],
+                  'comments_count')
+
+
+def follows_created(follows):
+    with transaction.atomic():
+        _bump_users_grouped([follow.author_id for follow in follows],
+                            'followers_count')
+        _bump_users_grouped([follow.user_id for follow in follows],
+                            'following_count')
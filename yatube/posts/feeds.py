@@ -0,0 +1,197 @@
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import feedgenerator
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+from django.utils.xmlutils import SimplerXMLGenerator
+from django.views.decorators.http import require_safe
+
+from . import conditional
+from .caching import tag_versions
+from .conditional import conditional_page
+from .models import Group, Post, User
+
+CHUNK_SIZE = 20
+TITLE_WORDS = 8
+ITEM_FIELDS = ('id', 'text', 'pub_date', 'updated', 'author__username',
+               'author__first_name', 'author__last_name', 'group__title')
+
+
+class StreamingFeed:
+    """Фид, который отдаётся по частям, не собирая все элементы в память.
+
+    Повторяет write() из django.utils.feedgenerator, но элементы
+    пишутся по одному прямо из итератора, а готовый XML отдаётся
+    кусками по chunk_size элементов.
+    """
+    item_element = 'item'
+
+    def __init__(self, *args, updated=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.updated = updated
+
+    def latest_post_date(self):
+        # Элементов ещё нет, а дата нужна в заголовке фида.
+        return self.updated or super().latest_post_date()
+
+    def stream(self, items, chunk_size=CHUNK_SIZE):
+        buffer = io.StringIO()
+        handler = SimplerXMLGenerator(buffer, 'utf-8',
+                                      short_empty_elements=True)
+        self.start_feed(handler)
+        for number, item in enumerate(items, 1):
+            self.add_item(**item)
+            item = self.items.pop()
+            handler.startElement(self.item_element,
+                                 self.item_attributes(item))
+            self.add_item_elements(handler, item)
+            handler.endElement(self.item_element)
+            if number % chunk_size == 0:
+                yield _drain(buffer)
+        self.end_feed(handler)
+        yield _drain(buffer)
+
+
+class AtomFeed(StreamingFeed, feedgenerator.Atom1Feed):
+    item_element = 'entry'
+
+    def start_feed(self, handler):
+        handler.startDocument()
+        handler.startElement('feed', self.root_attributes())
+        self.add_root_elements(handler)
+
+    def end_feed(self, handler):
+        handler.endElement('feed')
+
+
+class RssFeed(StreamingFeed, feedgenerator.Rss201rev2Feed):
+    def start_feed(self, handler):
+        handler.startDocument()
+        handler.startElement('rss', self.rss_attributes())
+        handler.startElement('channel', self.root_attributes())
+        self.add_root_elements(handler)
+
+    def end_feed(self, handler):
+        self.endChannelElement(handler)
+        handler.endElement('rss')
+
+
+FEEDS = {'atom': AtomFeed, 'rss': RssFeed}
+
+
+def _drain(buffer):
+    chunk = buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+
+def _item(request, row):
+    link = request.build_absolute_uri(
+        reverse('posts:post_detail', args=[row['id']]))
+    author = ' '.join(filter(None, (row['author__first_name'],
+                                    row['author__last_name'])))
+    return {
+        'title': Truncator(row['text']).words(TITLE_WORDS),
+        'link': link,
+        'unique_id': link,
+        'description': linebreaks(row['text'], autoescape=True),
+        'author_name': author or row['author__username'],
+        'pubdate': row['pub_date'],
+        'updateddate': row['updated'],
+        'categories': [row['group__title']] if row['group__title'] else (),
+    }
+
+
+def _cached_stream(key, versions, chunks):
+    # Фид попадает в кеш, только если был отдан целиком.
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.set(key, (b''.join(parts), versions),
+              settings.SYNDICATION_CACHE_TIMEOUT)
+
+
+def feed_scope(scope_func):
+    """Область страницы для фида: формат в URL на неё не влияет."""
+    def scope(request, kind, *args, **kwargs):
+        if kind not in FEEDS:
+            return None
+        return scope_func(request, *args, **kwargs)
+    return scope
+
+
+def feed_response(request, kind, scope, posts, title, link):
+    """Фид последних постов области scope.
+
+    Готовый XML хранится в кеше, пока не изменились версии тегов
+    области (их сбрасывает новый или изменённый пост); промах отдаётся
+    потоком прямо из курсора и по пути складывается в кеш.
+    """
+    feed_class = FEEDS.get(kind)
+    if feed_class is None or scope is None:
+        raise Http404
+    tags, updated = scope
+    key = 'syndication:' + hashlib.md5(
+        request.build_absolute_uri(request.path).encode()).hexdigest()
+    entry = cache.get(key)
+    if entry is not None:
+        content, versions = entry
+        if tag_versions(versions) == versions:
+            return HttpResponse(content, content_type=feed_class.content_type)
+    versions = tag_versions(['site', *tags], create=True)
+    feed = feed_class(
+        title=title, link=request.build_absolute_uri(link),
+        description=title, feed_url=request.build_absolute_uri(),
+        language='ru', updated=updated)
+    rows = posts.order_by('-pub_date', '-id').values(*ITEM_FIELDS)[
+        :settings.SYNDICATION_ITEMS].iterator(chunk_size=CHUNK_SIZE)
+    items = (_item(request, row) for row in rows)
+    return StreamingHttpResponse(
+        _cached_stream(key, versions, feed.stream(items)),
+        content_type=feed_class.content_type)
+
+
+index_scope = feed_scope(conditional.index_scope)
+group_scope = feed_scope(conditional.group_scope)
+profile_scope = feed_scope(conditional.profile_scope)
+
+
+@require_safe
+@conditional_page(index_scope)
+def index(request, kind):
+    return feed_response(
+        request, kind, conditional.page_scope(request, index_scope, kind),
+        Post.objects.all(), 'Последние обновления на сайте',
+        reverse('posts:index'))
+
+
+@require_safe
+@conditional_page(group_scope)
+def group_posts(request, slug, kind):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(
+        request, kind,
+        conditional.page_scope(request, group_scope, kind, slug=slug),
+        Post.objects.filter(group=group), group.title,
+        reverse('posts:group_post', args=[slug]))
+
+
+@require_safe
+@conditional_page(profile_scope)
+def profile(request, username, kind):
+    author = get_object_or_404(User, username=username)
+    return feed_response(
+        request, kind,
+        conditional.page_scope(request, profile_scope, kind,
+                               username=username),
+        Post.objects.filter(author=author),
+        f'Все посты пользователя {author}',
+        reverse('posts:profile', args=[username]))
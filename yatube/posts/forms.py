@@ -1,5 +1,9 @@
+from functools import partial
+
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images
 from .models import Post, Comment
 
 
@@ -11,6 +15,28 @@ class PostForm(forms.ModelForm):
         help_texts = {'text': 'Текст нового поста', 'group':
                       'Группа, к которой будет относиться пост'}
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'image' in self.fields:
+            # forms.ImageField открывает файл Pillow прямо в веб-процессе.
+            # Поле проверяет только, что файл загружен, а картинку
+            # разбирает images.inspect в песочнице (см. clean_image).
+            field = self.fields['image']
+            field.to_python = partial(forms.FileField.to_python, field)
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            # Полное декодирование - в песочнице, а не в веб-процессе;
+            # результат пригодится при сохранении поста.
+            try:
+                image.metadata = images.inspect(image)
+            except images.ImageRejected as error:
+                raise forms.ValidationError(
+                    f'Не удалось обработать картинку: {error}',
+                    code='invalid_image')
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -18,3 +44,43 @@ class CommentForm(forms.ModelForm):
         fields = ['text']
         labels = {'text': 'Добавить комментарий'}
         help_texts = {'text': 'Текст комментария'}
+
+
+class PrefetchedChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField с выбором из заранее загруженных объектов.
+
+    Не делает запрос к БД на каждое значение, поэтому подходит для
+    проверки пачек однотипных форм.
+    """
+
+    def __init__(self, objects, **kwargs):
+        self.objects = {str(obj.pk): obj for obj in objects}
+        super().__init__(**kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.objects[str(value)]
+        except KeyError:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice')
+
+
+class BulkPostForm(PostForm):
+    """PostForm для пакетной загрузки: без картинки, группы - из groups."""
+
+    class Meta(PostForm.Meta):
+        fields = ('text', 'group')
+
+    def __init__(self, *args, groups=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        field = self.fields['group']
+        self.fields['group'] = PrefetchedChoiceField(
+            groups, queryset=field.queryset, required=field.required,
+            label=field.label, help_text=field.help_text)
+
+    def _get_validation_exclusions(self):
+        # Группа уже найдена среди groups: повторная проверка модели
+        # сделала бы по запросу на каждую форму.
+        return [*super()._get_validation_exclusions(), 'group']
@@ -0,0 +1,154 @@
+import base64
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.parsers import parse_geometry
+
+from . import sandbox
+
+logger = logging.getLogger(__name__)
+
+# Размер LQIP-заглушки по большей стороне: несколько сотен байт,
+# которые браузер растягивает с размытием, пока грузится картинка
+LQIP_SIZE = 16
+LQIP_QUALITY = 50
+
+
+class ImageRejected(Exception):
+    """Картинка не читается или нарушает ограничения на размер."""
+
+
+def read_metadata(file, max_pixels=None):
+    """Ширина, высота и LQIP-заглушка (data URI) картинки из файла.
+
+    Картинки больше max_pixels отклоняются по заголовку, до декодирования.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        if max_pixels and width * height > max_pixels:
+            raise ImageRejected(
+                f'Картинка {width}x{height} больше допустимых '
+                f'{max_pixels} пикселей')
+        # Как в forms.ImageField: проверка структуры файла (контрольные
+        # суммы, конец данных). После verify картинку открывают заново.
+        image.verify()
+    file.seek(0)
+    with Image.open(file) as image:
+        # Для JPEG декодер сразу уменьшит картинку при чтении.
+        image.draft('RGB', (LQIP_SIZE * 4, LQIP_SIZE * 4))
+        preview = image.convert('RGB')
+    preview.thumbnail((LQIP_SIZE, LQIP_SIZE))
+    buffer = BytesIO()
+    preview.save(buffer, 'JPEG', quality=LQIP_QUALITY)
+    file.seek(0)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return width, height, f'data:image/jpeg;base64,{encoded}'
+
+
+def _inspect(source, max_pixels):
+    # Задача песочницы: source - путь к файлу или его содержимое.
+    # При SANDBOX_WORKERS = 0 она выполняется в веб-процессе, поэтому
+    # глобальный лимит Pillow восстанавливается.
+    default_max_pixels = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        if isinstance(source, bytes):
+            return read_metadata(BytesIO(source), max_pixels)
+        with open(source, 'rb') as file:
+            return read_metadata(file, max_pixels)
+    except (OSError, ValueError, SyntaxError,
+            Image.DecompressionBombError) as error:
+        raise ImageRejected(str(error) or 'Файл не является картинкой')
+    finally:
+        Image.MAX_IMAGE_PIXELS = default_max_pixels
+
+
+def inspect(file):
+    """Проверяет и читает картинку в песочнице (см. posts.sandbox).
+
+    file - загруженный или открытый файл; временные файлы загрузки
+    передаются процессу по пути, остальные - содержимым. Возвращает
+    (ширина, высота, LQIP), для плохой картинки - ImageRejected.
+    """
+    if hasattr(file, 'temporary_file_path'):
+        source = file.temporary_file_path()
+    else:
+        file.seek(0)
+        source = file.read()
+        file.seek(0)
+    try:
+        return sandbox.run(_inspect, source, settings.IMAGE_MAX_PIXELS)
+    except sandbox.SandboxError as error:
+        raise ImageRejected(str(error))
+
+
+class _Output:
+    # Вместо ImageFile миниатюры: engine.write отдаёт сюда готовые байты.
+    content = None
+
+    def write(self, content):
+        self.content = content
+
+
+def _render(source, variants):
+    # Задача песочницы: картинка декодируется один раз, и из неё
+    # создаются все варианты - так же, как в ThumbnailBackend sorl.
+    engine = default.engine
+    image = engine.get_image(BytesIO(source))
+    image.load()
+    image_info = engine.get_image_info(image)
+    rendered = []
+    for geometry_string, options in variants:
+        options = dict(options, image_info=image_info)
+        ratio = engine.get_image_ratio(image, options)
+        thumbnail = engine.create(
+            image, parse_geometry(geometry_string, ratio), options)
+        output = _Output()
+        engine.write(thumbnail, options, output)
+        rendered.append((output.content, engine.get_image_size(thumbnail)))
+    return engine.get_image_size(image), rendered
+
+
+def render(source, variants):
+    """Создаёт миниатюры картинки в песочнице (см. posts.sandbox).
+
+    source - содержимое картинки, variants - пары (geometry, options)
+    с опциями, уже дополненными как в sorl. Возвращает размер исходника
+    и пары (содержимое, размер) в порядке variants. Лимит времени -
+    THUMBNAIL_TIMEOUT на все варианты сразу.
+    """
+    return sandbox.run(_render, source, variants,
+                       timeout=settings.THUMBNAIL_TIMEOUT)
+
+
+def image_metadata(image):
+    """Метаданные картинки поста: сохранённой или только что загруженной.
+
+    Загрузка, уже проверенная формой, несёт метаданные с собой и
+    повторно не декодируется. Для нечитаемого или отсутствующего файла
+    возвращает пустые значения.
+    """
+    if not image:
+        return None, None, ''
+    try:
+        if not image._committed:
+            # Загрузка ещё не записана в хранилище: читаем её саму.
+            metadata = getattr(image.file, 'metadata', None)
+            return metadata or inspect(image.file)
+        with image.storage.open(image.name, 'rb') as file:
+            return inspect(file)
+    except (OSError, ImageRejected, SuspiciousOperation):
+        logger.warning('Не удалось прочитать картинку %s', image.name,
+                       exc_info=True)
+        return None, None, ''
+
+
+def update_post(post):
+    """Заполняет размеры и заглушку картинки поста (без сохранения)."""
+    post.image_width, post.image_height, post.image_lqip = image_metadata(
+        post.image)
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts import caching, images
+from posts.models import Post
+
+FIELDS = ('image_width', 'image_height', 'image_lqip', 'updated')
+
+
+class Command(BaseCommand):
+    help = ('Заполняет размеры и LQIP-заглушки картинок постов, '
+            'загруженных до появления этих полей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько постов обновлять за одну транзакцию.')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать и уже заполненные значения.')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').order_by('pk').only(
+            'pk', 'image', *FIELDS)
+        if not options['all']:
+            posts = posts.filter(image_width__isnull=True)
+        batch_size = options['batch_size']
+        done = failed = last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            now = timezone.now()
+            for post in batch:
+                images.update_post(post)
+                # Карточки с картинкой нужно перерисовать с размерами.
+                post.updated = now
+                if post.image_width is None:
+                    failed += 1
+            with transaction.atomic():
+                Post.objects.bulk_update(batch, FIELDS)
+            done += len(batch)
+            self.stdout.write(f'Обработано: {done}')
+        if done:
+            caching.bump_feed_generation()
+            caching.purge_tags('site')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {done}, не удалось прочитать: {failed}'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Заполняет ленты подписок по существующим подпискам (Follow).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить все записи лент перед заполнением.')
+        parser.add_argument(
+            '--push', action='store_true',
+            help='Только вернуть на раскладку pull-авторов, у которых '
+                 'подписчиков стало меньше TIMELINE_PUSH_THRESHOLD, и '
+                 'дозаполнить ленты их подписчиков.')
+
+    def handle(self, *args, **options):
+        if options['push']:
+            pushed = timeline.push_authors()
+            self.stdout.write(self.style.SUCCESS(
+                f'Возвращено на раскладку авторов: {pushed}'))
+            return
+        if options['clear']:
+            deleted, _ = TimelineEntry.objects.all().delete()
+            self.stdout.write(f'Удалено записей лент: {deleted}')
+        follows = Follow.objects.order_by('pk').values_list(
+            'user_id', 'author_id')
+        total = 0
+        for user_id, author_id in follows.iterator():
+            with transaction.atomic():
+                timeline.add_author(user_id, author_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано подписок: {total}, '
+            f'записей в лентах: {TimelineEntry.objects.count()}'))
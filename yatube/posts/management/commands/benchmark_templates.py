@@ -0,0 +1,91 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine
+from django.template.backends.django import get_installed_libraries
+from django.utils import timezone
+
+from posts.cards import CARD_TEMPLATE
+from posts.models import Group, Post, User
+
+# Вне DEBUG Django и так оборачивает загрузчики в cached.Loader, поэтому
+# обе версии замеряются с ним.
+LOADERS = [('django.template.loaders.cached.Loader', [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+])]
+SWITCHER_TEMPLATE = 'includes/switcher.html'
+
+
+def _engine():
+    return Engine(dirs=[settings.TEMPLATES_DIR], loaders=LOADERS,
+                  libraries=get_installed_libraries())
+
+
+def render_before(engine, posts, user):
+    # Как было: каждая карточка рендерится в своём Context, и вложенные
+    # {% include %} ищутся заново, переключатель - на каждый пост.
+    html = []
+    for post in posts:
+        html.append(engine.get_template(SWITCHER_TEMPLATE).render(
+            Context({'user': user, 'index': True})))
+        html.append(engine.get_template(CARD_TEMPLATE).render(
+            Context({'post': post})))
+    return html
+
+
+def render_after(engine, posts, user):
+    # Сейчас: общий Context для всех карточек (см. posts.cards),
+    # переключатель - один раз.
+    html = [engine.get_template(SWITCHER_TEMPLATE).render(
+        Context({'user': user, 'index': True}))]
+    template = engine.get_template(CARD_TEMPLATE)
+    context = Context()
+    for post in posts:
+        with context.push(post=post):
+            html.append(template.render(context))
+    return html
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время рендера карточек страницы ленты до и после '
+            'перехода на общий Context для карточек.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10, 50, 100],
+            help='Сколько постов на странице.')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз рендерить каждую страницу.')
+
+    def handle(self, *args, **options):
+        user = User(pk=1, username='reader')
+        group = Group(pk=1, title='Группа', slug='group')
+        posts = [
+            Post(pk=pk, text=f'Пост {pk}\nвторая строка', author=user,
+                 group=group, pub_date=timezone.now())
+            for pk in range(1, max(options['sizes']) + 1)
+        ]
+        before, after = _engine(), _engine()
+        render_before(before, posts[:1], user)
+        render_after(after, posts[:1], user)
+        self.stdout.write('Постов  до, мс  после, мс  ускорение')
+        for size in options['sizes']:
+            page = posts[:size]
+            timings = [
+                self.measure(render, engine, page, user, options['repeat'])
+                for render, engine in ((render_before, before),
+                                       (render_after, after))
+            ]
+            self.stdout.write(
+                f'{size:>6}  {timings[0]:>6.2f}  {timings[1]:>9.2f}  '
+                f'{timings[0] / timings[1]:>8.1f}x')
+
+    @staticmethod
+    def measure(render, engine, posts, user, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            render(engine, posts, user)
+        return (time.perf_counter() - started) / repeat * 1000
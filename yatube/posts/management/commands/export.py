@@ -0,0 +1,140 @@
+import csv
+import gzip
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.models import Comment, Follow, Group, Post, User
+
+# Модель, выгружаемые поля и поле водяного знака (None - только id).
+# Пароли и адреса почты пользователей не выгружаются.
+ENTITIES = {
+    'posts': (Post, ('id', 'author_id', 'group_id', 'text', 'image',
+                     'pub_date', 'updated'), 'updated'),
+    'comments': (Comment, ('id', 'post_id', 'author_id', 'text',
+                           'created'), 'created'),
+    'follows': (Follow, ('id', 'user_id', 'author_id'), None),
+    'groups': (Group, ('id', 'slug', 'title', 'description'), None),
+    'users': (User, ('id', 'username', 'first_name', 'last_name',
+                     'date_joined'), 'date_joined'),
+}
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class JsonLinesWriter:
+    def __init__(self, out, columns):
+        self.out = out
+        self.columns = columns
+
+    def write(self, row):
+        self.out.write(json.dumps(
+            dict(zip(self.columns, map(_plain, row))),
+            ensure_ascii=False) + '\n')
+
+
+class CsvWriter:
+    def __init__(self, out, columns):
+        self.writer = csv.writer(out)
+        self.writer.writerow(columns)
+
+    def write(self, row):
+        self.writer.writerow(map(_plain, row))
+
+
+WRITERS = {'jsonl': JsonLinesWriter, 'csv': CsvWriter}
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает посты, комментарии, подписки, группы или '
+            'пользователей в JSONL или CSV. Строки читаются курсором '
+            'пачками, поэтому память не зависит от размера таблицы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=ENTITIES)
+        parser.add_argument(
+            '--format', choices=WRITERS, default='jsonl',
+            help='Формат выгрузки.')
+        parser.add_argument(
+            '--output', default='-',
+            help='Файл выгрузки; по умолчанию - стандартный вывод.')
+        parser.add_argument(
+            '--gzip', action='store_true',
+            help='Сжимать выгрузку gzip (включается и для файлов *.gz).')
+        parser.add_argument(
+            '--since',
+            help='Выгрузить только записи, созданные или изменённые '
+                 'после этого момента (ISO 8601).')
+        parser.add_argument(
+            '--since-id', type=int, default=0,
+            help='id последней выгруженной записи: вместе с --since '
+                 'образует водяной знак предыдущей выгрузки.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Сколько строк читать из БД за раз.')
+
+    def queryset(self, entity, since, since_id):
+        model, columns, field = ENTITIES[entity]
+        rows = model.objects.all()
+        if field is None:
+            if since is not None:
+                raise CommandError(
+                    f'У {entity} нет даты изменения, используйте --since-id')
+            order = ('id',)
+            rows = rows.filter(id__gt=since_id)
+        else:
+            order = (field, 'id')
+            if since is not None:
+                rows = rows.filter(Q(**{f'{field}__gt': since}) | Q(
+                    **{field: since, 'id__gt': since_id}))
+            elif since_id:
+                rows = rows.filter(id__gt=since_id)
+        return rows.order_by(*order).values_list(*columns), columns, field
+
+    def open(self, output, compress):
+        compress = compress or output.endswith('.gz')
+        if output == '-':
+            if compress:
+                raise CommandError('Сжатая выгрузка пишется только в файл')
+            return self.stdout
+        if compress:
+            return gzip.open(output, 'wt', encoding='utf-8', newline='')
+        return open(output, 'w', encoding='utf-8', newline='')
+
+    def handle(self, *args, **options):
+        since = options['since']
+        if since is not None:
+            since = parse_datetime(since)
+            if since is None:
+                raise CommandError('--since: ожидается дата в ISO 8601')
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        rows, columns, field = self.queryset(
+            options['entity'], since, options['since_id'])
+        out = self.open(options['output'], options['gzip'])
+        exported, last = 0, None
+        try:
+            writer = WRITERS[options['format']](out, columns)
+            for last in rows.iterator(chunk_size=options['chunk_size']):
+                writer.write(last)
+                exported += 1
+        finally:
+            if out is not self.stdout:
+                out.close()
+        # Водяной знак печатается в stderr, чтобы не смешиваться с
+        # выгрузкой в stdout.
+        if last is None:
+            watermark = 'новых записей нет'
+        elif field is None:
+            watermark = f'--since-id {last[0]}'
+        else:
+            watermark = (f'--since {_plain(last[columns.index(field)])} '
+                         f'--since-id {last[0]}')
+        self.stderr.write(f'Выгружено: {exported}; следующая выгрузка: '
+                          f'{watermark}')
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = ('Создаёт миниатюры всех размеров из settings.POST_THUMBNAILS '
+            'для уже загруженных картинок постов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Сколько картинок обрабатывать параллельно '
+                 '(1 - в текущем потоке).')
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True).distinct()
+        workers = options['workers']
+        done = failed = 0
+        if workers <= 1:
+            for name in names.iterator():
+                if thumbnails.run(name):
+                    done += 1
+                else:
+                    failed += 1
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # Отдаём файлы пулу порциями, чтобы не держать в памяти
+                # задачи для всех картинок сразу.
+                for chunk in _chunks(names.iterator(), workers * 10):
+                    for ok in pool.map(thumbnails.process, chunk):
+                        if ok:
+                            done += 1
+                        else:
+                            failed += 1
+                    self.stdout.write(f'Обработано: {done + failed}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {done}, с ошибками: {failed}'))
@@ -0,0 +1,304 @@
+import csv
+import gzip
+import json
+import sys
+import time
+from collections import defaultdict
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import bulk, caching, counters, search, timeline
+from posts.models import Comment, Follow, Group, Post, User, UserStats
+
+MODELS = {'posts': Post, 'comments': Comment, 'follows': Follow,
+          'groups': Group, 'users': User}
+PROGRESS_INTERVAL = 5
+
+
+def _value(row, key):
+    # В CSV пустая ячейка - это отсутствующее значение.
+    value = row.get(key)
+    return None if value == '' else value
+
+
+def _int(row, key):
+    value = _value(row, key)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key}: ожидается число')
+
+
+def _date(row, key):
+    value = _value(row, key)
+    if value is None:
+        return None
+    date = parse_datetime(str(value))
+    if date is None:
+        raise ValueError(f'{key}: ожидается дата в ISO 8601')
+    return timezone.make_aware(date) if timezone.is_naive(date) else date
+
+
+def _text(row, key, required=True):
+    value = _value(row, key)
+    if value is None and required:
+        raise ValueError(f'{key}: обязательное поле')
+    return '' if value is None else str(value)
+
+
+def read_rows(path, fmt):
+    """Строки файла (или stdin для '-') вместе с номерами строк."""
+    name = path[:-3] if path.endswith('.gz') else path
+    fmt = fmt or ('csv' if name.endswith('.csv') else 'jsonl')
+    if path == '-':
+        stream = sys.stdin
+    elif path.endswith('.gz'):
+        stream = gzip.open(path, 'rt', encoding='utf-8', newline='')
+    else:
+        stream = open(path, encoding='utf-8', newline='')
+    with stream:
+        if fmt == 'csv':
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else None
+
+
+class Command(BaseCommand):
+    help = ('Импортирует посты, комментарии, подписки, группы или '
+            'пользователей из JSONL или CSV (в том числе выгрузки export). '
+            'Строки вставляются пачками, по транзакции на пачку; счётчики, '
+            'ленты и поисковый индекс обновляются один раз на пачку.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('entity', choices=MODELS)
+        parser.add_argument(
+            'path', help='Файл (*.jsonl, *.csv, можно *.gz) или - для stdin.')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='Формат; по умолчанию определяется по расширению.')
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Сколько строк вставлять за одну транзакцию.')
+
+    def handle(self, *args, **options):
+        self.entity = options['entity']
+        self.model = MODELS[self.entity]
+        # Авторы и группы ищутся в памяти, а не запросом на строку.
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.user_ids = set(self.users.values())
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.group_ids = set(self.groups.values())
+        self.imported = self.skipped = 0
+        started = reported = time.monotonic()
+        batch = []
+        try:
+            rows = read_rows(options['path'], options['format'])
+            for number, row in rows:
+                batch.append((number, row))
+                if len(batch) >= options['batch_size']:
+                    self.flush(batch)
+                    batch = []
+                    if time.monotonic() - reported >= PROGRESS_INTERVAL:
+                        reported = time.monotonic()
+                        self.stdout.write(
+                            f'Идёт импорт: {self.summary(started)}')
+            self.flush(batch)
+        except OSError as error:
+            raise CommandError(error)
+        finally:
+            self.finish()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, {self.summary(started)}'))
+
+    def summary(self, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        return (f'импортировано: {self.imported}, '
+                f'пропущено: {self.skipped}, '
+                f'{self.imported / elapsed:.0f} строк/с')
+
+    def skip(self, number, error):
+        self.skipped += 1
+        self.stderr.write(f'Строка {number}: {error}')
+
+    def flush(self, batch):
+        build = getattr(self, f'build_{self.entity}')
+        objs = []
+        for number, row in batch:
+            try:
+                if row is None:
+                    raise ValueError('ожидается объект JSON')
+                objs.append((number, build(row)))
+            except ValueError as error:
+                self.skip(number, error)
+        objs = self.exclude_existing(objs)
+        if not objs:
+            return
+        objs = [obj for _, obj in objs]
+        with transaction.atomic(), bulk.preserve_dates(self.model):
+            bulk.insert(self.model, objs)
+            getattr(self, f'after_{self.entity}')(objs)
+        self.imported += len(objs)
+
+    def exclude_existing(self, objs):
+        """Пропускает строки с id, которые уже есть в базе."""
+        ids = [obj.pk for _, obj in objs if obj.pk is not None]
+        existing = set(self.model.objects.filter(pk__in=ids).values_list(
+            'pk', flat=True)) if ids else set()
+        result = []
+        for number, obj in objs:
+            if obj.pk in existing:
+                self.skip(number, f'id {obj.pk} уже существует')
+            else:
+                result.append((number, obj))
+        # Проверки, которым нужна БД, делаются одним запросом на пачку.
+        prune = getattr(self, f'prune_{self.entity}', None)
+        return prune(result) if prune is not None and result else result
+
+    def finish(self):
+        if not self.imported:
+            return
+        # Строки могли вставляться с явными id: последовательности (PostgreSQL)
+        # должны продолжиться после них.
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [self.model])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+        caching.bump_feed_generation()
+        caching.purge_tags('site')
+
+    def reference(self, row, name, by_name, ids):
+        pk = _int(row, f'{name}_id')
+        if pk is None and _value(row, name) is not None:
+            pk = by_name.get(str(_value(row, name)))
+        if pk is None or pk not in ids:
+            raise ValueError(f'{name}: не найден')
+        return pk
+
+    def build_users(self, row):
+        username = _text(row, 'username')
+        if len(username) > 150:
+            raise ValueError('username: длиннее 150 символов')
+        if username in self.users:
+            raise ValueError(f'username: {username} уже существует')
+        # Сразу занимаем имя, чтобы повтор в той же пачке был пропущен.
+        self.users[username] = None
+        return User(
+            pk=_int(row, 'id'), username=username,
+            first_name=_text(row, 'first_name', False),
+            last_name=_text(row, 'last_name', False),
+            date_joined=_date(row, 'date_joined') or timezone.now(),
+            password=make_password(None))
+
+    def after_users(self, users):
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=user.pk) for user in users],
+            batch_size=bulk.BATCH_SIZE, ignore_conflicts=True)
+        for user in users:
+            self.users[user.username] = user.pk
+            self.user_ids.add(user.pk)
+
+    def build_groups(self, row):
+        slug = _text(row, 'slug')
+        if slug in self.groups:
+            raise ValueError(f'slug: {slug} уже существует')
+        self.groups[slug] = None
+        return Group(pk=_int(row, 'id'), slug=slug, title=_text(row, 'title'),
+                     description=_text(row, 'description', False))
+
+    def after_groups(self, groups):
+        for group in groups:
+            self.groups[group.slug] = group.pk
+            self.group_ids.add(group.pk)
+
+    def build_posts(self, row):
+        pub_date = _date(row, 'pub_date') or timezone.now()
+        group_id = None
+        if (_value(row, 'group_id') is not None
+                or _value(row, 'group') is not None):
+            group_id = self.reference(row, 'group', self.groups,
+                                      self.group_ids)
+        return Post(
+            pk=_int(row, 'id'), text=_text(row, 'text'),
+            author_id=self.reference(row, 'author', self.users,
+                                     self.user_ids),
+            group_id=group_id, pub_date=pub_date,
+            updated=_date(row, 'updated') or pub_date)
+
+    def after_posts(self, posts):
+        counters.posts_created(posts)
+        search.index_new_posts(posts)
+        by_author = defaultdict(list)
+        for post in posts:
+            by_author[post.author_id].append(post)
+        for author_posts in by_author.values():
+            timeline.fan_out_posts(author_posts)
+
+    def build_comments(self, row):
+        post_id = _int(row, 'post_id')
+        if post_id is None:
+            raise ValueError('post_id: обязательное поле')
+        return Comment(
+            pk=_int(row, 'id'), post_id=post_id, text=_text(row, 'text'),
+            author_id=self.reference(row, 'author', self.users,
+                                     self.user_ids),
+            created=_date(row, 'created') or timezone.now())
+
+    def prune_comments(self, objs):
+        # Держать в памяти id всех постов при миллионах строк дорого.
+        post_ids = set(Post.objects.filter(pk__in={
+            comment.post_id for _, comment in objs}).values_list(
+            'pk', flat=True))
+        result = []
+        for number, comment in objs:
+            if comment.post_id in post_ids:
+                result.append((number, comment))
+            else:
+                self.skip(number, 'post_id: не найден')
+        return result
+
+    def after_comments(self, comments):
+        counters.comments_created(comments)
+
+    def build_follows(self, row):
+        user_id = self.reference(row, 'user', self.users, self.user_ids)
+        author_id = self.reference(row, 'author', self.users, self.user_ids)
+        if user_id == author_id:
+            raise ValueError('нельзя подписаться на себя')
+        return Follow(pk=_int(row, 'id'), user_id=user_id,
+                      author_id=author_id)
+
+    def prune_follows(self, objs):
+        pairs = set(Follow.objects.filter(
+            user_id__in={follow.user_id for _, follow in objs},
+            author_id__in={follow.author_id for _, follow in objs},
+        ).values_list('user_id', 'author_id'))
+        result = []
+        for number, follow in objs:
+            pair = (follow.user_id, follow.author_id)
+            if pair in pairs:
+                self.skip(number, 'подписка уже существует')
+            else:
+                pairs.add(pair)
+                result.append((number, follow))
+        return result
+
+    def after_follows(self, follows):
+        counters.follows_created(follows)
+        timeline.add_follows(follows)
@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts import timeline
+from posts.counters import user_counts
+from posts.models import Comment, Group, Post, User, UserStats
+
+
+def _pk_batches(model, batch_size):
+    last_pk = 0
+    while True:
+        pks = list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+def _grouped_counts(queryset, column, pks):
+    return dict(queryset.filter(**{f'{column}__in': pks}).order_by().values(
+        column).annotate(total=Count('pk')).values_list(column, 'total'))
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счётчики пользователей, '
+            'групп и постов и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк проверять за одну транзакцию.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fixed = self.reconcile_users(batch_size)
+        self.stdout.write(f'Исправлено счётчиков пользователей: {fixed}')
+        fixed = self.reconcile_model(
+            Group, 'posts_count', Post.objects, 'group_id', batch_size)
+        self.stdout.write(f'Исправлено счётчиков групп: {fixed}')
+        fixed = self.reconcile_model(
+            Post, 'comments_count', Comment.objects, 'post_id', batch_size)
+        self.stdout.write(f'Исправлено счётчиков постов: {fixed}')
+
+    def reconcile_users(self, batch_size):
+        fixed = 0
+        fields = ('posts_count', 'followers_count', 'following_count')
+        for pks in _pk_batches(User, batch_size):
+            with transaction.atomic():
+                actual = user_counts(pks)
+                stored = UserStats.objects.select_for_update().in_bulk(pks)
+                missing, changed = [], []
+                for pk, values in actual.items():
+                    stats = stored.get(pk)
+                    if stats is None:
+                        missing.append(UserStats(user_id=pk, **values))
+                        continue
+                    if any(getattr(stats, field) != values[field]
+                           for field in fields):
+                        for field in fields:
+                            setattr(stats, field, values[field])
+                        changed.append(stats)
+                UserStats.objects.bulk_create(missing)
+                UserStats.objects.bulk_update(changed, fields)
+                # Исправленное число подписчиков может сменить режим лент.
+                for stats in missing + changed:
+                    timeline.update_mode(stats.user_id)
+                fixed += len(missing) + len(changed)
+        return fixed
+
+    def reconcile_model(self, model, field, related, column, batch_size):
+        fixed = 0
+        for pks in _pk_batches(model, batch_size):
+            with transaction.atomic():
+                actual = _grouped_counts(related, column, pks)
+                changed = []
+                rows = model.objects.select_for_update().filter(
+                    pk__in=pks).only('pk', field)
+                for obj in rows:
+                    total = actual.get(obj.pk, 0)
+                    if getattr(obj, field) != total:
+                        setattr(obj, field, total)
+                        changed.append(obj)
+                model.objects.bulk_update(changed, [field])
+                fixed += len(changed)
+        return fixed
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Показывает, сколько миниатюр нашёл пакетный поиск для '
+            'страниц лент и скольких ещё не было.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счётчики после вывода.')
+
+    def handle(self, *args, **options):
+        stats = thumbnails.prefetch_stats(reset=options['reset'])
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(
+            f'Найдено: {stats["hits"]}, нет: {stats["misses"]}, '
+            f'доля попаданий: {ratio:.1%}')
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pull_authors(apps, schema_editor):
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gte=settings.TIMELINE_PULL_THRESHOLD).update(
+        timeline_pull=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_export_watermark_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='timeline_pull',
+            field=models.BooleanField(default=False, editable=False, help_text='Посты автора не раскладываются по лентам подписчиков', verbose_name='Посты читаются при открытии ленты'),
+        ),
+        migrations.RunPython(mark_pull_authors, migrations.RunPython.noop),
+    ]
@@ -2,10 +2,36 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from core.models import CreatedModel
 
+from .storage import content_storage
+
 User = get_user_model()
 
 
-class Group(models.Model):
+class CountersModel(models.Model):
+    """Абстрактная модель с денормализованными счётчиками COUNTERS.
+
+    Счётчики меняются только атомарными UPDATE (см. posts.counters).
+    Полное сохранение существующего объекта их не пишет: иначе значение,
+    прочитанное до параллельного изменения, затёрло бы его.
+    """
+    COUNTERS = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if (not args and self.pk is not None and not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and field.name not in self.COUNTERS]
+        super().save(*args, **kwargs)
+
+
+class Group(CountersModel):
     title = models.CharField(verbose_name='Группа',
                              max_length=200, help_text='Название группы')
     slug = models.SlugField(verbose_name='Адрес для страницы с задачей',
@@ -15,25 +41,52 @@ class Group(models.Model):
                                       'дефисы и знаки подчёркивания')
     description = models.TextField(verbose_name='Тестовое описание',
                                    help_text='Тестовое описание')
+    posts_count = models.PositiveIntegerField(
+        'Число постов', default=0, editable=False)
+
+    COUNTERS = ('posts_count',)
 
     def __str__(self):
         return self.title
 
 
-class Post(models.Model):
+class Post(CountersModel):
     text = models.TextField(verbose_name='Пост', help_text='Написать пост')
     pub_date = models.DateTimeField('date published', auto_now_add=True)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='posts')
     group = models.ForeignKey(Group, on_delete=models.SET_NULL,
                               related_name='posts', blank=True, null=True,)
-    image = models.ImageField('Картинка', upload_to='posts/', blank=True)
+    image = models.ImageField('Картинка', upload_to='posts/', blank=True,
+                              storage=content_storage)
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False)
+    image_lqip = models.TextField(
+        'Заглушка картинки', blank=True, editable=False,
+        help_text='Крошечное превью в виде data URI')
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев', default=0, editable=False)
+
+    COUNTERS = ('comments_count',)
 
     def __str__(self):
         return self.text[:15]
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_feed_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_feed_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_feed_idx'),
+            models.Index(fields=['updated', 'id'],
+                         name='post_updated_idx'),
+        ]
 
 
 class Comment(CreatedModel):
@@ -43,6 +96,14 @@ class Comment(CreatedModel):
                                related_name='comments')
     text = models.TextField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created', 'id'],
+                         name='comment_post_created_idx'),
+            models.Index(fields=['created', 'id'],
+                         name='comment_created_idx'),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -61,3 +122,73 @@ class Follow(models.Model):
                 fields=['user', 'author'],
                 name='unique_pairs'),
         ]
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out-on-write), поэтому лента
+    подписок читается одним диапазоном по индексу (user, pub_date).
+    Посты авторов с большим числом подписчиков сюда не попадают и
+    подмешиваются при чтении (см. posts.timeline).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline',
+                             verbose_name='Читатель')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='timeline_entries',
+                             verbose_name='Пост')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='+',
+                               verbose_name='Автор поста')
+    pub_date = models.DateTimeField('date published')
+
+    class Meta:
+        ordering = ['-pub_date', '-post']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_post'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_post_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя.
+
+    Поддерживаются сигналами Post и Follow (см. posts.counters), при
+    расхождении исправляются командой reconcile_counters.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='stats',
+                                verbose_name='Пользователь')
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0, db_index=True)
+    following_count = models.PositiveIntegerField(
+        'Число подписок', default=0)
+    timeline_pull = models.BooleanField(
+        'Посты читаются при открытии ленты', default=False, editable=False,
+        help_text='Посты автора не раскладываются по лентам подписчиков')
+
+    def __str__(self):
+        return f'Счётчики {self.user_id}'
+
+
+class ImageBlob(models.Model):
+    """Файл в хранилище по содержимому и число постов, ссылающихся на него.
+
+    Одну и ту же картинку могут загрузить в несколько постов: файл
+    удаляется вместе с последней ссылкой (см. posts.blobs).
+    """
+    name = models.CharField('Имя файла', max_length=255, primary_key=True)
+    refs = models.PositiveIntegerField('Число ссылок', default=0)
+    created = models.DateTimeField('Дата загрузки', auto_now_add=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,107 @@
+import logging
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+try:
+    import resource
+except ImportError:  # не Unix: лимит памяти недоступен
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд сверх лимита задачи ждать процесс, прежде чем
+# считать его зависшим и пересоздать пул
+KILL_GRACE = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class SandboxError(Exception):
+    """Задача превысила лимиты или процесс песочницы аварийно завершился."""
+
+
+def _limit_resources(memory_limit):
+    # Выполняется в каждом процессе пула при его запуске.
+    if resource is not None and memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _timeout(signum, frame):
+    raise SandboxError('Превышено время выполнения задачи')
+
+
+def _call(func, args, timeout):
+    # Декодеры Pillow отдают управление интерпретатору между блоками
+    # данных, поэтому SIGALRM прерывает и долгое декодирование.
+    alarm = (hasattr(signal, 'SIGALRM')
+             and threading.current_thread() is threading.main_thread())
+    if alarm:
+        previous = signal.signal(signal.SIGALRM, _timeout)
+        signal.alarm(timeout)
+    try:
+        return func(*args)
+    except MemoryError:
+        raise SandboxError('Превышен лимит памяти задачи')
+    finally:
+        if alarm:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.SANDBOX_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_limit_resources,
+                initargs=(settings.SANDBOX_MEMORY_LIMIT,))
+    return _executor
+
+
+def _discard_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    # Зависший процесс сам не завершится: shutdown его не прерывает.
+    for process in list(getattr(executor, '_processes', {}).values()):
+        process.kill()
+    executor.shutdown(wait=False)
+
+
+def run(func, *args, timeout=None):
+    """Выполняет func(*args) в изолированном процессе с лимитами.
+
+    Процессы пула ограничены по памяти (SANDBOX_MEMORY_LIMIT), каждая
+    задача - по времени (timeout секунд, по умолчанию SANDBOX_TIMEOUT),
+    так что тяжёлые входные данные не занимают процессор и память
+    веб-процесса. func и аргументы должны сериализоваться pickle.
+    При SANDBOX_WORKERS = 0 задача выполняется в текущем процессе,
+    а лимит времени действует только в главном потоке.
+    """
+    timeout = timeout or settings.SANDBOX_TIMEOUT
+    if not settings.SANDBOX_WORKERS:
+        return _call(func, args, timeout)
+    executor = get_executor()
+    future = executor.submit(_call, func, args, timeout)
+    try:
+        return future.result(timeout=timeout + KILL_GRACE)
+    except FutureTimeout:
+        logger.warning('Задача %s зависла, пул песочницы пересоздаётся',
+                       func.__name__)
+        _discard_executor(executor)
+        raise SandboxError('Превышено время выполнения задачи')
+    except BrokenProcessPool:
+        logger.warning('Процесс песочницы аварийно завершился на %s',
+                       func.__name__)
+        _discard_executor(executor)
+        raise SandboxError('Процесс песочницы аварийно завершился')
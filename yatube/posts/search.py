@@ -0,0 +1,140 @@
+import re
+
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def fts_enabled():
+    """Полнотекстовый индекс есть только у SQLite (модуль FTS5)."""
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Переводит пользовательский запрос в безопасное выражение MATCH.
+
+    Каждое слово берётся в кавычки (операторы FTS5 из запроса не
+    работают) и ищется по префиксу, чтобы находить словоформы.
+    """
+    terms = re.findall(r'\w+', query)
+    return ' '.join('"{}"*'.format(term.replace('"', '""'))
+                    for term in terms)
+
+
+def index_post(post):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       [post.pk])
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                       f'VALUES (%s, %s)', [post.pk, post.text])
+
+
+def index_new_posts(posts):
+    """Добавляет в индекс только что созданные посты одним executemany."""
+    if not fts_enabled() or not posts:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                           f'VALUES (%s, %s)',
+                           [(post.pk, post.text) for post in posts])
+
+
+def unindex_post(post_id):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       [post_id])
+
+
+def rebuild_index():
+    """Перестраивает индекс по всем постам; возвращает число записей."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                       f'SELECT id, text FROM posts_post')
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) "
+                       f"VALUES ('optimize')")
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+class SearchResults:
+    """Ленивый список найденных постов, упорядоченный по релевантности.
+
+    Поддерживает count() и срезы, поэтому его можно передать в
+    Paginator: каждая страница - один запрос к индексу FTS5 с LIMIT.
+    """
+
+    def __init__(self, query, group_id=None, author_id=None):
+        self.match = match_expression(query)
+        self.query = query
+        self.group_id = group_id
+        self.author_id = author_id
+        self._count = None
+
+    def _where(self):
+        sql = [f'{FTS_TABLE} MATCH %s']
+        params = [self.match]
+        if self.group_id is not None:
+            sql.append('p.group_id = %s')
+            params.append(self.group_id)
+        if self.author_id is not None:
+            sql.append('p.author_id = %s')
+            params.append(self.author_id)
+        return ' AND '.join(sql), params
+
+    def _fallback(self):
+        posts = Post.objects.all()
+        for term in re.findall(r'\w+', self.query):
+            posts = posts.filter(text__icontains=term)
+        if self.group_id is not None:
+            posts = posts.filter(group_id=self.group_id)
+        if self.author_id is not None:
+            posts = posts.filter(author_id=self.author_id)
+        return posts
+
+    def count(self):
+        if self._count is None:
+            if not self.match:
+                self._count = 0
+            elif not fts_enabled():
+                self._count = self._fallback().count()
+            else:
+                where, params = self._where()
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'SELECT COUNT(*) FROM {FTS_TABLE} '
+                        f'JOIN posts_post p ON p.id = {FTS_TABLE}.rowid '
+                        f'WHERE {where}', params)
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        limit = (index.stop if index.stop is not None
+                 else self.count()) - start
+        if not self.match or limit <= 0:
+            return []
+        if not fts_enabled():
+            return list(self._fallback().select_related(
+                'author', 'group')[start:start + limit])
+        where, params = self._where()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT p.id FROM {FTS_TABLE} '
+                f'JOIN posts_post p ON p.id = {FTS_TABLE}.rowid '
+                f'WHERE {where} ORDER BY {FTS_TABLE}.rank, p.id DESC '
+                f'LIMIT %s OFFSET %s', params + [limit, start])
+            ids = [row[0] for row in cursor.fetchall()]
+        found = Post.objects.select_related('author', 'group').in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found]
@@ -0,0 +1,104 @@
+from .models import Post
+
+
+class BadRequest(Exception):
+    """Неверные параметры запроса к API: ответ 400 с текстом ошибки."""
+
+
+def _isoformat(value):
+    return value and value.isoformat()
+
+
+def _image_url(value):
+    # В строках .values() - имя файла, у объектов модели - FieldFile.
+    name = getattr(value, 'name', value)
+    if not name:
+        return None
+    return Post._meta.get_field('image').storage.url(name)
+
+
+def _path_getter(column):
+    path = column.split('__')
+
+    def getter(obj):
+        for attr in path:
+            if obj is None:
+                return None
+            obj = getattr(obj, attr)
+        return obj
+    return getter
+
+
+class Serializer:
+    """Быстрое преобразование строк выборки в словари для JSON.
+
+    Поля описываются в fields как имя -> (путь в ORM, преобразование).
+    Для строк .values() сериализатор не создаёт объекты моделей и не
+    вызывает __str__: значения берутся из словаря по заранее
+    вычисленному списку колонок. Объекты моделей (например, из ленты
+    подписок) тоже поддерживаются - по тем же путям через атрибуты.
+    """
+    fields = {}
+    # Колонки, которые нужны для курсора, даже если их нет в ?fields=
+    cursor_columns = ()
+
+    def __init__(self, names=None):
+        names = list(self.fields) if names is None else list(names)
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise BadRequest(f'Неизвестные поля: {", ".join(unknown)}')
+        self.specs = [(name, *self.fields[name]) for name in names]
+
+    @classmethod
+    def from_request(cls, request):
+        """Сериализатор для полей из ?fields=a,b (по умолчанию - всех)."""
+        fields = request.GET.get('fields')
+        if not fields:
+            return cls()
+        return cls(name.strip() for name in fields.split(',') if name.strip())
+
+    def columns(self):
+        return list(dict.fromkeys(
+            [*self.cursor_columns, *(column for _, column, _ in self.specs)]))
+
+    def values(self, queryset):
+        return queryset.values(*self.columns())
+
+    def dump(self, rows):
+        if not rows:
+            return []
+        if isinstance(rows[0], dict):
+            specs = self.specs
+            return [{name: convert(row[column]) if convert else row[column]
+                     for name, column, convert in specs} for row in rows]
+        getters = [(name, _path_getter(column), convert)
+                   for name, column, convert in self.specs]
+        return [{name: convert(get(obj)) if convert else get(obj)
+                 for name, get, convert in getters} for obj in rows]
+
+
+class PostSerializer(Serializer):
+    fields = {
+        'id': ('id', None),
+        'text': ('text', None),
+        'pub_date': ('pub_date', _isoformat),
+        'updated': ('updated', _isoformat),
+        'author': ('author__username', None),
+        'group': ('group__slug', None),
+        'image': ('image', _image_url),
+        'image_width': ('image_width', None),
+        'image_height': ('image_height', None),
+        'comments_count': ('comments_count', None),
+    }
+    cursor_columns = ('pub_date', 'id')
+
+
+class CommentSerializer(Serializer):
+    fields = {
+        'id': ('id', None),
+        'post': ('post_id', None),
+        'author': ('author__username', None),
+        'text': ('text', None),
+        'created': ('created', _isoformat),
+    }
+    cursor_columns = ('created', 'id')
@@ -0,0 +1,125 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import (blobs, cards, caching, counters, images, search,
+               thumbnails, timeline)
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not instance.pk:
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        # Вход в систему сохраняет только last_login: запрос не нужен.
+        return
+    instance._old_username = User.objects.filter(
+        pk=instance.pk).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    old_username = vars(instance).pop('_old_username', instance.username)
+    if raw:
+        return
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    elif old_username != instance.username:
+        # Карточки постов содержат имя автора и ссылку на его профиль.
+        caching.bump_feed_generation()
+        caching.purge_tags('site', cards.author_card_tag(instance.pk))
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.pk:
+        instance._old_group_id, instance._old_image = Post.objects.filter(
+            pk=instance.pk).values_list('group_id', 'image').first() or (
+            None, None)
+    if instance.image.name != getattr(instance, '_old_image', None):
+        # Размеры и заглушка считаются один раз при загрузке, чтобы
+        # шаблонам не приходилось открывать файл.
+        images.update_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    caching.bump_feed_generation()
+    caching.purge_tags('index', *caching.post_tags(
+        instance, getattr(instance, '_old_group_id', None)))
+    search.index_post(instance)
+    old_image = getattr(instance, '_old_image', None)
+    if instance.image.name != old_image:
+        blobs.acquire(instance.image.name, instance.image.storage)
+        blobs.release(old_image, instance.image.storage)
+        if instance.image:
+            thumbnails.schedule(instance.image.name)
+    if created:
+        counters.post_created(instance)
+        timeline.fan_out_post(instance)
+        return
+    old_group_id = getattr(instance, '_old_group_id', instance.group_id)
+    if old_group_id != instance.group_id:
+        counters.post_group_changed(old_group_id, instance.group_id)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    caching.bump_feed_generation()
+    caching.purge_tags('index', *caching.post_tags(instance))
+    counters.post_deleted(instance)
+    search.unindex_post(instance.pk)
+    blobs.release(instance.image.name, instance.image.storage)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    caching.bump_feed_generation()
+    # Карточки постов содержат адрес группы: с новой версией тега они
+    # перерисуются под новыми ключами. После удаления группы у постов
+    # group_id = None, и ключи карточек меняются сами.
+    caching.purge_tags('site', cards.group_card_tag(instance.pk))
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    caching.bump_feed_generation()
+    caching.purge_tags('site')
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.comment_created(instance)
+        caching.purge_tags(f'post:{instance.post_id}')
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.comment_deleted(instance)
+    caching.purge_tags(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.follow_created(instance)
+        caching.purge_tags(f'author:{instance.author_id}',
+                           f'author:{instance.user_id}')
+        timeline.update_mode(instance.author_id)
+        timeline.add_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.follow_deleted(instance)
+    caching.purge_tags(f'author:{instance.author_id}',
+                       f'author:{instance.user_id}')
+    # Обратно на раскладку автора переводит команда backfill_timelines.
+    timeline.remove_author(instance.user_id, instance.author_id)
@@ -0,0 +1,64 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME = re.compile(r'(?:.*/)?([0-9a-f]{2})/\1[0-9a-f]{62}(?:\.\w+)?')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по SHA-256 их содержимого.
+
+    Одинаковые загрузки получают одно имя <каталог>/<aa>/<sha256>.<ext>
+    и хранятся один раз, а миниатюры sorl, которые именуются по имени
+    исходника, создаются для них тоже один раз. Хеш считается по ходу
+    записи во временный файл, без повторного чтения загрузки. Число
+    ссылок на файл ведёт posts.blobs.
+    """
+
+    def is_hashed(self, name):
+        """Создан ли файл name этим хранилищем (имя - хеш содержимого)."""
+        return bool(name) and HASHED_NAME.fullmatch(name) is not None
+
+    def get_available_name(self, name, max_length=None):
+        # Окончательное имя известно только после записи, а совпадение
+        # имён означает совпадение содержимого.
+        return name
+
+    def _save(self, name, content):
+        directory, basename = posixpath.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+        digest = hashlib.sha256()
+        descriptor, temporary = tempfile.mkstemp(
+            dir=full_directory, suffix='.part')
+        try:
+            with os.fdopen(descriptor, 'wb') as destination:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    destination.write(chunk)
+            hashed = digest.hexdigest()
+            name = posixpath.join(directory, hashed[:2], hashed + extension)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                os.remove(temporary)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                file_move_safe(temporary, full_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+
+content_storage = ContentAddressedStorage()
@@ -0,0 +1,11 @@
+from django import template
+
+from posts.cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(page_obj):
+    """{% post_cards page_obj as cards %} - карточки постов страницы."""
+    return render_cards(page_obj)
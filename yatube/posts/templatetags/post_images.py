@@ -0,0 +1,17 @@
+from django import template
+
+from posts.thumbnails import responsive_image, thumbnail_or_placeholder
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(image, geometry):
+    """{% post_thumbnail post.image "960x339" as im %} без Pillow в запросе."""
+    return thumbnail_or_placeholder(image, geometry)
+
+
+@register.inclusion_tag('includes/post_picture.html')
+def post_picture(image, geometry):
+    """{% post_picture post.image "960x339" %}: <picture> с srcset."""
+    return {'picture': responsive_image(image, geometry)}
@@ -0,0 +1,205 @@
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='ts', description='Описание')
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {number}',
+                                group=cls.group if number % 2 else None)
+            for number in range(15)
+        ]
+        cls.post = cls.posts[-1]
+        for number in range(3):
+            Comment.objects.create(post=cls.post, author=cls.reader,
+                                   text=f'Комментарий {number}')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(f'api_v1:{name}', args=args), params)
+
+    def test_index_pages_through_all_posts(self):
+        response = self.get('index', limit=10)
+        data = response.json()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(data['results'][0]['text'], 'Пост 14')
+        self.assertEqual(data['results'][0]['author'], 'author')
+        self.assertIsNone(data['previous'])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([post['text'] for post in data['results']],
+                         [f'Пост {number}' for number in range(4, -1, -1)])
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+    def test_index_queries(self):
+        self.get('index')
+        with self.assertNumQueries(2):
+            self.get('index')
+
+    def test_fields_selection(self):
+        data = self.get('index', fields='id,group').json()
+        self.assertEqual(set(data['results'][0]), {'id', 'group'})
+        self.assertIsNone(data['results'][0]['group'])
+        self.assertEqual(data['results'][1]['group'], 'ts')
+        response = self.get('index', fields='id,password')
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_bad_request_is_400(self):
+        response = self.get('index', limit='много')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], 'limit должен быть числом')
+        # Ошибка в коде - не ошибка клиента: она не маскируется под 400.
+        with mock.patch('posts.serializers.PostSerializer.dump',
+                        side_effect=ValueError('сбой')):
+            with self.assertRaises(ValueError):
+                self.get('index')
+
+    def test_group_and_profile_feeds(self):
+        data = self.get('group_posts', 'ts').json()
+        self.assertTrue(all(post['group'] == 'ts'
+                            for post in data['results']))
+        self.assertEqual(self.get('group_posts', 'missing').status_code, 404)
+        data = self.get('profile', 'reader').json()
+        self.assertEqual(data['results'], [])
+
+    def test_post_detail_and_comments(self):
+        data = self.get('post_detail', self.post.pk).json()
+        self.assertEqual(data['id'], self.post.pk)
+        self.assertEqual(data['comments_count'], 3)
+        data = self.get('comments', self.post.pk, limit=2,
+                        order='newest').json()
+        self.assertEqual([comment['text'] for comment in data['results']],
+                         ['Комментарий 2', 'Комментарий 1'])
+        self.assertEqual(self.get('post_detail', 10 ** 6).status_code, 404)
+
+    def test_follow_feed(self):
+        self.assertEqual(self.get('follow_index').status_code, 401)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        data = self.get('follow_index', fields='id').json()
+        self.assertEqual(data['results'][0], {'id': self.post.pk})
+        self.assertIsNotNone(data['next'])
+
+    def send(self, name, data):
+        return self.client.post(reverse(f'api_v1:{name}'), json.dumps(data),
+                                content_type='application/json')
+
+    def test_bulk_posts(self):
+        self.assertEqual(self.send('bulk_posts', []).status_code, 401)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.author)
+        items = [{'text': f'Новый {number}', 'group': self.group.pk}
+                 for number in range(20)]
+        items += [{'text': ''}, {'text': 'Пост', 'group': 999}, 'пост']
+        with self.assertNumQueries(15):
+            response = self.send('bulk_posts', items)
+        results = response.json()['results']
+        created = [result['id'] for result in results[:20]]
+        self.assertEqual(
+            list(Post.objects.filter(pk__in=created).order_by(
+                'pk').values_list('text', flat=True)),
+            [f'Новый {number}' for number in range(20)])
+        self.assertEqual([result['status'] for result in results[20:]],
+                         ['invalid'] * 3)
+        self.assertIn('text', results[20]['errors'])
+        self.assertIn('group', results[21]['errors'])
+        self.assertEqual(results[22]['index'], 22)
+        self.author.stats.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(self.author.stats.posts_count, 35)
+        self.assertEqual(self.group.posts_count, 27)
+        self.assertEqual(
+            self.reader.timeline.filter(post_id__in=created).count(), 20)
+
+    def test_bulk_posts_rejects_bad_body(self):
+        self.client.force_login(self.author)
+        self.assertEqual(self.send('bulk_posts', {}).status_code, 400)
+        items = [{'text': 'Пост'}] * 501
+        self.assertEqual(self.send('bulk_posts', items).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse('api_v1:bulk_posts')).status_code, 405)
+
+    def test_bulk_comments(self):
+        self.client.force_login(self.reader)
+        results = self.send('bulk_comments', [
+            {'post': self.post.pk, 'text': 'Ещё'},
+            {'post': self.posts[0].pk, 'text': 'Первый'},
+            {'post': 999, 'text': 'Мимо'},
+            {'post': self.post.pk, 'text': ''},
+        ]).json()['results']
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'created', 'invalid', 'invalid'])
+        self.assertEqual(Comment.objects.get(pk=results[1]['id']).text,
+                         'Первый')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 4)
+
+    def test_bulk_follows(self):
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=other)
+        self.client.force_login(self.reader)
+        results = self.send('bulk_follows', [
+            {'author': 'author'}, {'author': 'other'}, {'author': 'reader'},
+            {'author': 'nobody'}, {'author': 'author'},
+        ]).json()['results']
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'exists', 'invalid', 'invalid',
+                          'exists'])
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author).exists())
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.followers_count, 1)
+        self.assertEqual(self.reader.timeline.count(), 15)
+
+    def test_bulk_rejects_non_scalar_references(self):
+        self.client.force_login(self.reader)
+        for name, items, key in (
+                ('bulk_posts', [{'text': 'Пост', 'group': [1]},
+                                {'text': 'Пост', 'group': {}}], 'group'),
+                ('bulk_comments', [{'post': [self.post.pk], 'text': 'Да'},
+                                   {'post': {}, 'text': 'Да'}], '__all__'),
+                ('bulk_follows', [{'author': ['author']},
+                                  {'author': {}}], 'author')):
+            with self.subTest(name=name):
+                response = self.send(name, items)
+                self.assertEqual(response.status_code, 200)
+                for result in response.json()['results']:
+                    self.assertEqual(result['status'], 'invalid')
+                    self.assertIn(key, result['errors'])
+
+    def test_bulk_follows_concurrent_follow(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        filter_follows = Follow.objects.filter
+        # Проверка видит базу до подписки из параллельного запроса.
+        stale = [Follow.objects.none()]
+        with mock.patch.object(
+                Follow.objects, 'filter',
+                lambda *args, **kwargs: (stale.pop() if stale
+                                         else filter_follows(*args,
+                                                             **kwargs))):
+            results = self.send('bulk_follows', [
+                {'author': 'author'}]).json()['results']
+        self.assertEqual(results[0]['status'], 'exists')
+        self.assertEqual(Follow.objects.filter(
+            user=self.reader, author=self.author).count(), 1)
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.followers_count, 1)
@@ -0,0 +1,178 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from .. import timeline
+from ..models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+class ExportCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth', email='a@b.c')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Пост, "{number}"',
+                                group=cls.group)
+            for number in range(5)
+        ]
+
+    def export(self, *args, **options):
+        out, err = StringIO(), StringIO()
+        call_command('export', *args, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_jsonl_with_watermark(self):
+        out, err = self.export('posts', chunk_size=2)
+        rows = [json.loads(line) for line in out.splitlines()]
+        self.assertEqual([row['id'] for row in rows],
+                         [post.pk for post in self.posts])
+        self.assertEqual(rows[0]['text'], 'Пост, "0"')
+        self.assertEqual(rows[0]['group_id'], self.group.pk)
+        watermark = err.split('следующая выгрузка: ')[1].split()
+        self.assertEqual(watermark[3], str(self.posts[-1].pk))
+        self.posts[1].text = 'Изменённый'
+        self.posts[1].save()
+        out, _ = self.export('posts', since=watermark[1],
+                             since_id=int(watermark[3]))
+        rows = [json.loads(line) for line in out.splitlines()]
+        self.assertEqual([row['text'] for row in rows], ['Изменённый'])
+
+    def test_csv_gzip_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.csv.gz')
+            self.export('users', format='csv', output=path)
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                rows = list(csv.reader(file))
+        self.assertEqual(rows[0], ['id', 'username', 'first_name',
+                                   'last_name', 'date_joined'])
+        self.assertEqual(rows[1][1], 'auth')
+        self.assertNotIn('a@b.c', str(rows))
+
+    def test_id_watermark(self):
+        out, err = self.export('follows')
+        self.assertEqual(out, '')
+        self.assertIn('новых записей нет', err)
+        follow = Follow.objects.create(
+            user=User.objects.create_user(username='reader'),
+            author=self.user)
+        out, _ = self.export('follows', since_id=follow.pk - 1)
+        self.assertEqual(json.loads(out)['author_id'], self.user.pk)
+        with self.assertRaises(CommandError):
+            self.export('follows', since='2020-01-01T00:00:00')
+
+
+class ImportCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def load(self, entity, name, lines, **options):
+        path = os.path.join(self.directory.name, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as file:
+            file.write(lines)
+        out, err = StringIO(), StringIO()
+        call_command('import', entity, path, stdout=out, stderr=err,
+                     **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_posts_jsonl(self):
+        rows = [
+            {'author': 'auth', 'group': 'group', 'text': 'Старый пост',
+             'pub_date': '2015-03-01T10:00:00+00:00'},
+            {'author_id': self.user.pk, 'text': 'Без группы'},
+            {'author': 'nobody', 'text': 'Чужой'},
+            {'author': 'auth', 'group': 'missing', 'text': 'Мимо'},
+            {'author': 'auth', 'text': ''},
+        ]
+        lines = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+        out, err = self.load('posts', 'posts.jsonl.gz', lines, batch_size=2)
+        self.assertIn('импортировано: 2, пропущено: 4', out)
+        self.assertIn('строк/с', out)
+        self.assertIn('Строка 3: author: не найден', err)
+        old = Post.objects.get(text='Старый пост')
+        self.assertEqual(old.pub_date.year, 2015)
+        self.assertEqual(old.updated, old.pub_date)
+        self.assertEqual(old.group, self.group)
+        self.assertEqual(self.stats(self.user).posts_count, 2)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.reader.timeline.count(), 2)
+
+    def test_export_round_trip_keeps_ids(self):
+        post = Post.objects.create(author=self.user, text='Пост')
+        out = StringIO()
+        call_command('export', 'posts', stdout=out, stderr=StringIO())
+        exported = out.getvalue()
+        pk = post.pk
+        post.delete()
+        self.load('posts', 'posts.jsonl', exported)
+        self.assertEqual(Post.objects.get(pk=pk).text, 'Пост')
+        _, err = self.load('posts', 'again.jsonl', exported)
+        self.assertIn(f'id {pk} уже существует', err)
+
+    def test_users_groups_comments_follows_csv(self):
+        self.load('users', 'users.csv',
+                  'username,first_name\nlegacy,Лев\nauth,\n')
+        legacy = User.objects.get(username='legacy')
+        self.assertFalse(legacy.has_usable_password())
+        self.assertTrue(UserStats.objects.filter(user=legacy).exists())
+        self.load('groups', 'groups.csv', 'slug,title\nold,Старая\n')
+        self.assertTrue(Group.objects.filter(slug='old').exists())
+        post = Post.objects.create(author=self.user, text='Пост')
+        self.load('comments', 'comments.csv',
+                  f'post_id,author,text,created\n'
+                  f'{post.pk},legacy,Ответ,2016-01-01T00:00:00\n'
+                  f'999,legacy,Мимо,\n')
+        comment = Comment.objects.get(post=post)
+        self.assertEqual(comment.created.year, 2016)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        out, err = self.load('follows', 'follows.csv',
+                             'user,author\nlegacy,auth\nreader,auth\n'
+                             'legacy,legacy\nlegacy,auth\n')
+        self.assertIn('импортировано: 1, пропущено: 3', out)
+        self.assertEqual(self.stats(legacy).following_count, 1)
+        self.assertEqual(legacy.timeline.count(), 1)
+
+    def test_follows_timelines_filled_per_batch(self):
+        authors = [User.objects.create_user(username=f'writer{number}')
+                   for number in range(2)]
+        for author in authors:
+            Post.objects.create(author=author, text='Пост')
+        readers = [User.objects.create_user(username=f'fan{number}')
+                   for number in range(10)]
+        lines = 'user,author\n' + ''.join(
+            f'{reader.username},{author.username}\n'
+            for reader in readers[5:] for author in authors)
+        # Режимы, pull-авторы, посты и вставка в ленты - по запросу на
+        # пачку, сколько бы подписок в ней ни было.
+        follows = [Follow(user=reader, author=author)
+                   for reader in readers[:5] for author in authors]
+        with self.assertNumQueries(4):
+            timeline.add_follows(follows)
+        self.load('follows', 'follows.csv', lines)
+        for reader in readers:
+            self.assertEqual(reader.timeline.count(), 2)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
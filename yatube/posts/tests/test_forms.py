@@ -1,8 +1,15 @@
+import time
+from io import BytesIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from http import HTTPStatus
+from PIL import Image
 
+from .. import images, sandbox
 from ..forms import PostForm
 from ..models import Group, Post, Comment
 
@@ -93,3 +100,52 @@ class PostURLTests(TestCase):
                          'Замена текста')
         self.assertEqual(response_2.context.get('comments').author,
                          self.user)
+
+
+class ImageSandboxTest(TestCase):
+    @staticmethod
+    def upload(size):
+        buffer = BytesIO()
+        Image.new('RGB', size, (0, 90, 0)).save(buffer, 'PNG')
+        return SimpleUploadedFile('image.png', buffer.getvalue(),
+                                  content_type='image/png')
+
+    def test_valid_image_decoded_in_sandbox(self):
+        form = PostForm(data={'text': 'Текст'},
+                        files={'image': self.upload((40, 20))})
+        self.assertTrue(form.is_valid())
+        width, height, lqip = form.cleaned_data['image'].metadata
+        self.assertEqual((width, height), (40, 20))
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_image_over_pixel_limit_rejected(self):
+        form = PostForm(data={'text': 'Текст'},
+                        files={'image': self.upload((100, 100))})
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    def test_broken_image_rejected(self):
+        upload = self.upload((40, 20))
+        broken = SimpleUploadedFile('image.png', upload.read()[:80],
+                                    content_type='image/png')
+        form = PostForm(data={'text': 'Текст'}, files={'image': broken})
+        self.assertFalse(form.is_valid())
+
+    def test_form_field_does_not_open_image(self):
+        upload = self.upload((40, 20))
+        field = PostForm().fields['image']
+        with mock.patch('PIL.Image.open', side_effect=AssertionError):
+            self.assertIs(field.to_python(upload), upload)
+
+    @override_settings(SANDBOX_WORKERS=0, IMAGE_MAX_PIXELS=1000)
+    def test_pixel_limit_restored_after_inline_task(self):
+        default = Image.MAX_IMAGE_PIXELS
+        images.inspect(self.upload((20, 20)))
+        with self.assertRaises(images.ImageRejected):
+            images.inspect(self.upload((100, 100)))
+        self.assertEqual(Image.MAX_IMAGE_PIXELS, default)
+
+    @override_settings(SANDBOX_TIMEOUT=1)
+    def test_task_time_limit(self):
+        with self.assertRaises(sandbox.SandboxError):
+            sandbox.run(time.sleep, 5)
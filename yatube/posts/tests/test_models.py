@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -82,3 +85,78 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_post_counters(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        self.assertEqual(self.stats(self.user).posts_count, 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        post.group = None
+        post.save()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        post.delete()
+        self.assertEqual(self.stats(self.user).posts_count, 0)
+
+    def test_comment_counter(self):
+        post = Post.objects.create(author=self.user, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_full_save_keeps_counters(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        stale_post = Post.objects.get(pk=post.pk)
+        stale_group = Group.objects.get(pk=self.group.pk)
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        Post.objects.create(author=self.user, text='Ещё', group=self.group)
+        # Правка поста и группы из формы или админки - полный save().
+        stale_post.text = 'Новый текст'
+        stale_post.save()
+        stale_group.title = 'Новое название'
+        stale_group.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Новый текст')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Group.objects.get(pk=self.group.pk).posts_count, 2)
+
+    def test_follow_counters(self):
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(self.stats(self.user).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.stats(self.user).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_reconcile_counters_repairs_drift(self):
+        Post.objects.bulk_create([
+            Post(author=self.user, text='Пост', group=self.group)
+            for _ in range(3)])
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.stats(self.user).posts_count, 3)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 3)
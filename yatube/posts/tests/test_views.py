@@ -1,22 +1,44 @@
+import os
 import shutil
+import subprocess
+import sys
 import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
 from posts.forms import PostForm
-from django.core.cache import cache
+from django.core.cache import cache, caches
+from django.core.management import call_command
 from genericpath import exists
+from PIL import Image
+from sorl.thumbnail.conf import settings as sorl_settings
 
-from ..models import Post, Group, Follow
+from .. import images, sandbox, thumbnails, timeline, views
+from ..cards import card_key
+from ..models import (Comment, Post, Group, Follow, ImageBlob,
+                      TimelineEntry)
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 User = get_user_model()
 
 
+def run_in_other_process(code):
+    """Выполняет код в отдельном процессе, как команда manage.py."""
+    return subprocess.run(
+        [sys.executable, '-c',
+         f'import django; django.setup(); {code}'],
+        cwd=settings.BASE_DIR, check=True, capture_output=True, text=True,
+        env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'yatube.settings'}
+    ).stdout
+
+
 class PostURLTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -240,19 +262,771 @@ class PiginatorViewsTest(TestCase):
         self.assertEqual(len(response.context['page_obj']), 0)
 
     def test_cache_index_page(self):
-        """Проверяем что главная страница кешируется на 20 секунд."""
-        Post.objects.create(
-            text='Текст тестировки кэша',
-            author=self.user,
-        )
+        """Фрагмент главной кешируется и сбрасывается новым постом."""
         response_one = self.authorized_client.get(reverse('posts:index'))
+        with self.assertNumQueries(4):
+            response_two = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response_one.content, response_two.content)
         Post.objects.create(
             text='Текст тестировки кэша',
             author=self.user,
         )
-        response_two = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(response_one.content, response_two.content)
-        cache.clear()
-
         response_three = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response_one.content, response_three.content)
+        self.assertContains(response_three, 'Текст тестировки кэша')
+
+    def test_cache_index_page_varies_by_page(self):
+        first = self.authorized_client.get(reverse('posts:index'))
+        second = self.authorized_client.get(
+            reverse('posts:index') + '?page=2')
+        self.assertNotEqual(first.content, second.content)
+        self.assertContains(second, 'Пост №0')
+
+
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='ts',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create([Post(
+            text='Пост №' + str(i),
+            author=cls.user,
+            group=cls.group) for i in range(13)])
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        cache.clear()
+
+    def test_cursor_pages_cover_feed(self):
+        """Курсорные страницы обходят ленту без пропусков и повторов."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_post', kwargs={'slug': 'ts'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+        )
+        expected = list(Post.objects.order_by(
+            '-pub_date', '-pk').values_list('pk', flat=True))
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                first = self.authorized_client.get(
+                    url + '?cursor=').context['page_obj']
+                self.assertEqual(len(first), 10)
+                self.assertFalse(first.has_previous())
+                cache.clear()
+                second = self.authorized_client.get(
+                    url + '?cursor=' + first.next_cursor
+                ).context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertFalse(second.has_next())
+                seen = [post.pk for post in first] + [
+                    post.pk for post in second]
+                self.assertEqual(seen, expected)
+                cache.clear()
+                back = self.authorized_client.get(
+                    url + '?cursor=' + second.previous_cursor
+                ).context['page_obj']
+                self.assertEqual([post.pk for post in back],
+                                 [post.pk for post in first])
+
+    def test_broken_cursor_returns_first_page(self):
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?cursor=broken')
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def follow_feed(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_follow_adds_existing_posts(self):
+        post = Post.objects.create(author=self.author, text='Старый пост')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.follow_feed(), [post.pk])
+
+    def test_new_post_fans_out_to_followers(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(self.follow_feed(), [post.pk])
+
+    def test_unfollow_and_delete_prune_timeline(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        other = Post.objects.create(author=self.author, text='Ещё пост')
+        other.delete()
+        self.assertEqual(self.follow_feed(), [post.pk])
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'author'}))
+        self.assertEqual(self.follow_feed(), [])
+
+    def test_backfill_command(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        TimelineEntry.objects.all().delete()
+        call_command('backfill_timelines', stdout=StringIO())
+        self.assertEqual(self.follow_feed(), [post.pk])
+
+
+@override_settings(TIMELINE_PULL_THRESHOLD=2)
+class HybridTimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.star = User.objects.create_user(username='star')
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.fan = User.objects.create_user(username='fan')
+
+    def setUp(self):
+        cache.clear()
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.fan, author=self.star)
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_star_post_is_not_fanned_out(self):
+        post = Post.objects.create(author=self.star, text='Пост звезды')
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=post).exists())
+
+    def test_follow_feed_merges_pushed_and_pulled_posts(self):
+        posts = []
+        for i in range(12):
+            author = self.star if i % 2 else self.author
+            posts.append(Post.objects.create(author=author, text=str(i)))
+        expected = [post.pk for post in reversed(posts)]
+        first = self.reader_client.get(
+            reverse('posts:follow_index')).context['page_obj']
+        second = self.reader_client.get(
+            reverse('posts:follow_index') + '?cursor=' + first.next_cursor
+        ).context['page_obj']
+        self.assertEqual(
+            [post.pk for post in first] + [post.pk for post in second],
+            expected)
+        self.assertFalse(second.has_next())
+
+
+@override_settings(TIMELINE_PULL_THRESHOLD=3, TIMELINE_PUSH_THRESHOLD=2)
+class TimelineModeSwitchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.star = User.objects.create_user(username='star')
+        cls.readers = [User.objects.create_user(username=f'reader{number}')
+                       for number in range(4)]
+
+    def setUp(self):
+        cache.clear()
+
+    def follow_feed(self, user):
+        client = Client()
+        client.force_login(user)
+        page_obj = client.get(reverse('posts:follow_index')).context[
+            'page_obj']
+        return [post.pk for post in page_obj]
+
+    def test_posts_written_in_pull_mode_survive_unfollows(self):
+        for reader in self.readers[:3]:
+            Follow.objects.create(user=reader, author=self.star)
+        self.assertTrue(timeline.is_pull_author(self.star.pk))
+        post = Post.objects.create(author=self.star, text='Пост звезды')
+        Follow.objects.create(user=self.readers[3], author=self.star)
+        self.assertEqual(self.follow_feed(self.readers[3]), [post.pk])
+        # 4 -> 3 -> 2 подписчика: автор остаётся в pull-режиме.
+        for reader in self.readers[:2]:
+            Follow.objects.filter(user=reader).delete()
+            self.assertTrue(timeline.is_pull_author(self.star.pk))
+        # 2 -> 1: ниже TIMELINE_PUSH_THRESHOLD, но отписка ленты не
+        # заполняет - это делает команда.
+        Follow.objects.filter(user=self.readers[2]).delete()
+        self.assertTrue(timeline.is_pull_author(self.star.pk))
+        reader = self.readers[3]
+        self.assertEqual(self.follow_feed(reader), [post.pk])
+        self.assertFalse(reader.timeline.exists())
+        out = StringIO()
+        call_command('backfill_timelines', '--push', stdout=out)
+        self.assertIn('Возвращено на раскладку авторов: 1', out.getvalue())
+        self.assertFalse(timeline.is_pull_author(self.star.pk))
+        self.assertEqual(self.follow_feed(reader), [post.pk])
+        self.assertTrue(reader.timeline.filter(post=post).exists())
+        self.assertEqual(self.follow_feed(self.readers[0]), [])
+
+    @override_settings(TIMELINE_BACKFILL_POSTS=2)
+    def test_push_backfills_only_recent_posts(self):
+        for reader in self.readers[:3]:
+            Follow.objects.create(user=reader, author=self.star)
+        posts = [Post.objects.create(author=self.star, text=f'Пост {number}')
+                 for number in range(3)]
+        Follow.objects.filter(user__in=self.readers[:2]).delete()
+        timeline.push_authors()
+        self.assertEqual(
+            set(self.readers[2].timeline.values_list('post_id', flat=True)),
+            {posts[1].pk, posts[2].pk})
+
+
+class CommentsPageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        cls.comments = [
+            Comment.objects.create(post=cls.post, author=cls.user,
+                                   text=f'Комментарий {i}')
+            for i in range(25)
+        ]
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+    def test_comments_are_paginated_without_extra_queries(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        page = response.context['comments']
+        self.assertEqual([c.pk for c in page],
+                         [c.pk for c in self.comments[:20]])
+        response = self.client.get(
+            url + '?comments_cursor=' + page.next_cursor)
+        self.assertEqual([c.pk for c in response.context['comments']],
+                         [c.pk for c in self.comments[20:]])
+
+    def test_newest_comments_first(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+            + '?comments=newest')
+        self.assertEqual(response.context['comments'][0], self.comments[-1])
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='ts',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Карточка', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cards_are_shared_between_feeds(self):
+        self.client.get(reverse('posts:index'))
+        self.assertIsNotNone(cache.get(card_key(self.post)))
+        response = self.client.get(
+            reverse('posts:group_post', kwargs={'slug': 'ts'}))
+        self.assertContains(response, 'Карточка')
+
+    def test_edit_renders_new_card(self):
+        self.client.get(reverse('posts:index'))
+        self.post.text = 'Новый текст карточки'
+        self.post.save()
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'author'}))
+        self.assertContains(response, 'Новый текст карточки')
+
+    def test_group_change_renders_new_card(self):
+        self.client.get(reverse('posts:index'))
+        updated = Post.objects.get(pk=self.post.pk).updated
+        self.group.slug = 'new-slug'
+        self.group.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '/group/new-slug/')
+        # Посты группы не переписываются.
+        self.assertEqual(Post.objects.get(pk=self.post.pk).updated, updated)
+
+    def test_username_change_renders_new_card(self):
+        self.client.get(reverse('posts:index'))
+        author = User.objects.get(pk=self.user.pk)
+        author.username = 'renamed'
+        author.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Автор: renamed')
+        self.assertContains(response, '/profile/renamed/')
+        self.assertNotContains(response, '/profile/author/')
+
+    def test_group_delete_renders_new_card(self):
+        self.client.get(reverse('posts:index'))
+        Group.objects.get(pk=self.group.pk).delete()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Карточка')
+        self.assertNotContains(response, '/group/ts/')
+
+    def test_feed_generation_bumped_from_other_process(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('posts:index'))
+        # bulk_create не вызывает сигналов: фрагмент ленты остаётся в кеше.
+        Post.objects.bulk_create([Post(author=self.user, text='Без сигнала')])
+        self.assertNotContains(self.client.get(reverse('posts:index')),
+                               'Без сигнала')
+        run_in_other_process(
+            'from posts import caching; caching.bump_feed_generation()')
+        self.assertContains(self.client.get(reverse('posts:index')),
+                            'Без сигнала')
+
+    def test_switcher_rendered_once_per_page(self):
+        Post.objects.create(author=self.user, text='Вторая карточка')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Избранные авторы', count=1)
+
+    def test_benchmark_templates_command(self):
+        out = StringIO()
+        call_command('benchmark_templates', sizes=[1, 3], repeat=1,
+                     stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[2].strip().startswith('3 '))
+
+
+class AnonymousPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.id})
+
+    def test_anonymous_page_served_from_cache(self):
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+
+    def test_comment_purges_post_page(self):
+        self.client.get(self.url)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Новый комментарий')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Новый комментарий')
+
+    def test_follow_purges_profile_page(self):
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        self.client.get(url)
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user)
+        self.assertContains(self.client.get(url), 'Подписчиков: 1')
+
+    def test_purge_during_render_is_not_lost(self):
+        url = reverse('posts:index')
+        paginate = views.paginate
+
+        def paginate_then_post(*args, **kwargs):
+            page_obj = paginate(*args, **kwargs)
+            list(page_obj)
+            # Пост появляется, когда страница уже прочитана из БД.
+            Post.objects.create(author=self.user, text='Пост во время рендера')
+            return page_obj
+
+        with mock.patch.object(views, 'paginate', paginate_then_post):
+            self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Пост во время рендера')
+
+    def test_purge_from_other_process(self):
+        self.client.get(self.url)
+        run_in_other_process(
+            f"from posts import caching; "
+            f"caching.purge_tags('post:{self.post.pk}')")
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+
+    def test_logged_in_user_is_not_cached(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_not_modified_for_matching_etag(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+        for client in (self.client, self.authorized_client):
+            for url in urls:
+                with self.subTest(url=url):
+                    etag = client.get(url)['ETag']
+                    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 304)
+
+    def test_anonymous_not_modified_without_queries(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_follows_database_without_purge(self):
+        url = reverse('posts:index')
+        etag = self.authorized_client.get(url)['ETag']
+        # bulk_create не вызывает сигналов: версии тегов не меняются.
+        Post.objects.bulk_create([Post(author=self.user, text='Новый')])
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes_after_login(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        etag = self.authorized_client.get(url)['ETag']
+        self.authorized_client.logout()
+        self.authorized_client.force_login(self.user)
+        # Вход меняет CSRF-токен: страница с формой комментария и старым
+        # токеном не годится.
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_no_last_modified(self):
+        url = reverse('posts:index')
+        since = self.authorized_client.get(url).get(
+            'Last-Modified', 'Thu, 01 Jan 2099 00:00:00 GMT')
+        self.post.text = 'Изменённый пост'
+        self.post.save()
+        for client in (self.client, self.authorized_client):
+            response = client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('Last-Modified'))
+            self.assertContains(response, 'Изменённый пост')
+
+    def test_etag_changes_after_edit(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        self.post.text = 'Изменённый пост'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class SyndicationFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='ts', description='Описание')
+        for number in range(25):
+            Post.objects.create(author=cls.user, text=f'Пост <{number}>',
+                                group=cls.group if number % 2 else None)
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch(self, url):
+        response = self.client.get(url)
+        if response.streaming:
+            return response, b''.join(response.streaming_content).decode()
+        return response, response.content.decode()
+
+    def test_feeds_stream_latest_posts(self):
+        urls = {
+            reverse('posts:index_feed', args=['atom']): 25,
+            reverse('posts:index_feed', args=['rss']): 25,
+            reverse('posts:group_feed', args=['ts', 'atom']): 12,
+            reverse('posts:profile_feed', args=['author', 'rss']): 25,
+        }
+        for url, count in urls.items():
+            with self.subTest(url=url):
+                response, content = self.fetch(url)
+                self.assertTrue(response.streaming)
+                self.assertIn('xml', response['Content-Type'])
+                self.assertEqual(content.count('<entry>')
+                                 + content.count('<item>'), count)
+                self.assertTrue(content.rstrip().endswith(
+                    ('</feed>', '</rss>')))
+
+    def test_item_text_escaped(self):
+        _, content = self.fetch(reverse('posts:index_feed', args=['atom']))
+        self.assertIn('<title>Пост &lt;24&gt;</title>', content)
+        self.assertIn('&lt;p&gt;Пост &amp;lt;24&amp;gt;&lt;/p&gt;', content)
+
+    def test_unknown_feed(self):
+        urls = (
+            reverse('posts:index_feed', args=['json']),
+            reverse('posts:group_feed', args=['missing', 'atom']),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_feed_cached_until_new_post_in_scope(self):
+        url = reverse('posts:group_feed', args=['ts', 'atom'])
+        _, content = self.fetch(url)
+        response, cached = self.fetch(url)
+        self.assertFalse(response.streaming)
+        self.assertEqual(cached, content)
+        Post.objects.create(author=self.user, text='Вне группы')
+        response, _ = self.fetch(url)
+        self.assertFalse(response.streaming)
+        Post.objects.create(author=self.user, text='Новый', group=self.group)
+        response, content = self.fetch(url)
+        self.assertTrue(response.streaming)
+        self.assertIn('Новый', content)
+
+    def test_conditional_get(self):
+        url = reverse('posts:index_feed', args=['rss'])
+        response, _ = self.fetch(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='ts',
+            description='Тестовое описание',
+        )
+        cls.cats = Post.objects.create(
+            author=cls.user, group=cls.group,
+            text='Кошки любят спать, кошки любят есть')
+        cls.dogs = Post.objects.create(
+            author=cls.other, text='Собаки и одна кошка')
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, **params):
+        response = self.client.get(reverse('posts:search'), params)
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_search_ranks_by_relevance(self):
+        self.assertEqual(self.found(q='кошк'), [self.cats.pk, self.dogs.pk])
+
+    def test_search_filters(self):
+        self.assertEqual(self.found(q='кошк', group='ts'), [self.cats.pk])
+        self.assertEqual(self.found(q='кошк', author='other'),
+                         [self.dogs.pk])
+
+    def test_index_follows_edits_and_deletes(self):
+        dogs = Post.objects.get(pk=self.dogs.pk)
+        dogs.text = 'Только собаки'
+        dogs.save()
+        self.assertEqual(self.found(q='кошк'), [self.cats.pk])
+        self.assertEqual(self.found(q='собаки'), [self.dogs.pk])
+        dogs.delete()
+        self.assertEqual(self.found(q='собаки'), [])
+
+    def test_operators_in_query_are_ignored(self):
+        self.assertEqual(self.found(q='"кошки* (спать'), [self.cats.pk])
+
+    def test_rebuild_command_indexes_bulk_created_posts(self):
+        Post.objects.bulk_create([
+            Post(author=self.user, text='Попугаи')])
+        self.assertEqual(self.found(q='попугаи'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.found(q='попугаи')), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False)
+class ThumbnailPipelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 600), (200, 30, 30)).save(buffer, 'JPEG')
+        self.post = Post.objects.create(
+            author=self.user, text='Пост с картинкой',
+            image=SimpleUploadedFile('big.jpg', buffer.getvalue(),
+                                     content_type='image/jpeg'))
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        image = self.post.image
+        placeholder = thumbnails.thumbnail_or_placeholder(image, '960x339')
+        self.assertTrue(placeholder.is_placeholder)
+        self.assertEqual(placeholder.url, image.url)
+        self.assertTrue(thumbnails.run(image.name))
+        thumbnail = thumbnails.thumbnail_or_placeholder(image, '960x339')
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+
+    @override_settings(SANDBOX_WORKERS=0)
+    def test_source_decoded_once_in_sandbox(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1000, 500), (90, 60, 30)).save(buffer, 'JPEG')
+        post = Post.objects.create(
+            author=self.user, text='Новая картинка',
+            image=SimpleUploadedFile('new.jpg', buffer.getvalue(),
+                                     content_type='image/jpeg'))
+        with mock.patch.object(sandbox, 'run', wraps=sandbox.run) as run, \
+                mock.patch.object(Image, 'open', wraps=Image.open) as open_:
+            self.assertTrue(thumbnails.generate(post.image.name))
+        run.assert_called_once()
+        self.assertIs(run.call_args[0][0], images._render)
+        open_.assert_called_once()
+        self.assertFalse(thumbnails.generate(post.image.name))
+
+    def test_card_shows_thumbnail_after_generation(self):
+        url = reverse('posts:index')
+        self.assertContains(self.client.get(url), self.post.image.url)
+        thumbnails.run(self.post.image.name)
+        thumbnail = thumbnails.cached_thumbnail(self.post.image, '960x339')
+        self.assertContains(self.client.get(url), thumbnail.url)
+
+    def test_generate_thumbnails_command(self):
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        self.assertIsNotNone(
+            thumbnails.cached_thumbnail(self.post.image, '960x339'))
+
+    def test_prefetch_reads_thumbnails_in_one_query(self):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 400), (30, 30, 200)).save(buffer, 'JPEG')
+        other = Post.objects.create(
+            author=self.user, text='Ещё одна картинка',
+            image=SimpleUploadedFile('other.jpg', buffer.getvalue(),
+                                     content_type='image/jpeg'))
+        thumbnails.run(self.post.image.name)
+        cache.clear()
+        caches[sorl_settings.THUMBNAIL_CACHE].clear()
+        posts = [Post.objects.get(pk=self.post.pk),
+                 Post.objects.get(pk=other.pk)]
+        count = len(thumbnails.variants())
+        with self.assertNumQueries(1):
+            self.assertEqual(thumbnails.prefetch(posts), (count, count))
+        with self.assertNumQueries(0):
+            self.assertEqual(thumbnails.prefetch(posts), (count, count))
+            thumbnail = thumbnails.thumbnail_or_placeholder(
+                posts[0].image, '960x339')
+        self.assertFalse(getattr(thumbnail, 'is_placeholder', False))
+        out = StringIO()
+        call_command('thumbnail_stats', reset=True, stdout=out)
+        self.assertIn(f'Найдено: {2 * count}, нет: {2 * count}',
+                      out.getvalue())
+        self.assertEqual(thumbnails.prefetch_stats(),
+                         {'hits': 0, 'misses': 0})
+
+    def test_thumbnail_stats_from_other_process(self):
+        thumbnails.prefetch_stats(reset=True)
+        hits, misses = thumbnails.prefetch(
+            [Post.objects.get(pk=self.post.pk)])
+        out = run_in_other_process(
+            "from django.core.management import call_command; "
+            "call_command('thumbnail_stats', reset=True)")
+        self.assertIn(f'Найдено: {hits}, нет: {misses}', out)
+        self.assertGreater(hits + misses, 0)
+
+    def test_picture_has_srcset_and_dimensions(self):
+        thumbnails.run(self.post.image.name)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        picture = thumbnails.responsive_image(
+            Post.objects.get(pk=self.post.pk).image, '960x339')
+        self.assertEqual((picture.width, picture.height), (960, 339))
+        # Вариант 1440 не увеличивает оригинал шириной 1200.
+        self.assertEqual(
+            [item.split()[1] for item in picture.srcset.split(', ')],
+            ['480w', '960w', '1200w'])
+        self.assertContains(response, f'srcset="{picture.srcset}"')
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_image_metadata_stored_on_upload(self):
+        self.assertEqual((self.post.image_width, self.post.image_height),
+                         (1200, 600))
+        self.assertTrue(self.post.image_lqip.startswith(
+            'data:image/jpeg;base64,'))
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        self.assertContains(response, 'width="1200" height="600"')
+        self.assertContains(response, self.post.image_lqip)
+
+    def test_backfill_image_metadata_command(self):
+        Post.objects.filter(pk=self.post.pk).update(
+            image_width=None, image_height=None, image_lqip='')
+        call_command('backfill_image_metadata', stdout=StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.image_width, post.image_height), (1200, 600))
+        self.assertEqual(post.image_lqip, self.post.image_lqip)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False)
+class ContentAddressedStorageTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='author')
+        buffer = BytesIO()
+        Image.new('RGB', (600, 300), (10, 120, 10)).save(buffer, 'JPEG')
+        self.content = buffer.getvalue()
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, filename):
+        return Post.objects.create(
+            author=self.user, text='Мем',
+            image=SimpleUploadedFile(filename, self.content,
+                                     content_type='image/jpeg'))
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.create_post('meme.jpg')
+        second = self.create_post('meme-copy.JPG')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.storage.is_hashed(first.image.name))
+        self.assertEqual(ImageBlob.objects.get(name=first.image.name).refs, 2)
+        self.assertIsNotNone(
+            thumbnails.cached_thumbnail(second.image, '960x339'))
+
+    def test_file_removed_with_last_reference(self):
+        first = self.create_post('meme.jpg')
+        second = self.create_post('meme.jpg')
+        name, storage = first.image.name, first.image.storage
+        first.delete()
+        self.assertTrue(storage.exists(name))
+        second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(ImageBlob.objects.exists())
@@ -0,0 +1,416 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    KVStore as CachedDBKVStore)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import images
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_STATS_KEY = 'thumbnails:prefetch'
+
+_executor = None
+_executor_lock = Lock()
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, умеющий искать готовую миниатюру без её создания."""
+
+    def normalize_options(self, source, options):
+        # Та же подготовка опций, что и в ThumbnailBackend.get_thumbnail:
+        # от неё зависит имя файла миниатюры.
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        options = self.normalize_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра из kvstore или None, если её ещё нет."""
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options))
+
+
+backend = PostThumbnailBackend()
+
+
+def geometry_options(geometry):
+    """Опции миниатюры для размера из settings.POST_THUMBNAILS."""
+    return settings.POST_THUMBNAILS[geometry]
+
+
+def cached_thumbnail(image, geometry):
+    if not image:
+        return None
+    return backend.get_cached_thumbnail(
+        image, geometry, **geometry_options(geometry))
+
+
+def image_formats():
+    """Форматы из POST_IMAGE_FORMATS, которые умеют сохранять Pillow и sorl."""
+    Image.init()
+    return [image_format for image_format in settings.POST_IMAGE_FORMATS
+            if image_format in Image.SAVE and image_format in EXTENSIONS]
+
+
+def srcset_geometry(width):
+    ratio_width, ratio_height = settings.POST_IMAGE_RATIO
+    return f'{width}x{round(width * ratio_height / ratio_width)}'
+
+
+def srcset_variants():
+    """Адаптивные варианты для srcset: пары (geometry, options).
+
+    Каждая ширина POST_IMAGE_WIDTHS в каждом доступном современном
+    формате и в JPEG. Варианты не увеличивают картинку больше оригинала.
+    """
+    return [
+        (srcset_geometry(width),
+         {'crop': 'center', 'upscale': False, 'format': image_format})
+        for image_format in image_formats() + ['JPEG']
+        for width in settings.POST_IMAGE_WIDTHS
+    ]
+
+
+def variants():
+    """Все миниатюры картинки поста: POST_THUMBNAILS и варианты srcset."""
+    return list(settings.POST_THUMBNAILS.items()) + srcset_variants()
+
+
+def _variant_key(geometry, options):
+    return geometry, options.get('format')
+
+
+class Placeholder:
+    """Картинка вместо ещё не готовой миниатюры."""
+    is_placeholder = True
+
+    def __init__(self, url, width=None, height=None, lqip=''):
+        self.url = url
+        self.width = width
+        self.height = height
+        self.lqip = lqip
+
+
+class ResponsiveImage:
+    """Готовая миниатюра с вариантами для srcset.
+
+    url, width и height - основная миниатюра из POST_THUMBNAILS,
+    srcset - её JPEG-варианты, sources - пары (MIME-тип, srcset)
+    для современных форматов, lqip - заглушка на время загрузки.
+    Размеры берутся из kvstore sorl.
+    """
+    is_placeholder = False
+
+    def __init__(self, thumbnail, srcset, sources, lqip=''):
+        self.url = thumbnail.url
+        self.width = thumbnail.width
+        self.height = thumbnail.height
+        self.srcset = srcset
+        self.sources = sources
+        self.sizes = settings.POST_IMAGE_SIZES
+        self.lqip = lqip
+
+
+def _kvstore_get_many(image_files):
+    """Пакетный аналог default.kvstore.get для списка ImageFile.
+
+    Для cached_db-хранилища sorl все ключи читаются одним get_many из
+    кеша, а промахи - одним запросом к таблице kvstore.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        return {image_file.key: kvstore.get(image_file)
+                for image_file in image_files}
+    raw_keys = {add_prefix(image_file.key): image_file.key
+                for image_file in image_files}
+    values = kvstore.cache.get_many(list(raw_keys))
+    missing = [key for key in raw_keys if key not in values]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        fetched = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(fetched,
+                               sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    result = {}
+    for raw_key, key in raw_keys.items():
+        value = values.get(raw_key)
+        if not value or value == EMPTY_VALUE:
+            result[key] = None
+        else:
+            result[key] = deserialize_image_file(value)
+    return result
+
+
+def prefetch(posts):
+    """Находит миниатюры всех постов страницы за один проход по kvstore.
+
+    Результат сохраняется в post._prefetched_thumbnails и используется
+    тегом post_thumbnail вместо отдельного запроса на каждую картинку.
+    Возвращает число найденных и ненайденных миниатюр.
+    """
+    wanted = []
+    for post in posts:
+        if not post.image:
+            continue
+        for geometry, options in variants():
+            wanted.append((post, _variant_key(geometry, options),
+                           backend.thumbnail_file(
+                               post.image, geometry, **options)))
+    if not wanted:
+        return 0, 0
+    found = _kvstore_get_many([image_file for _, _, image_file in wanted])
+    hits = misses = 0
+    for post, variant, image_file in wanted:
+        thumbnail = found[image_file.key]
+        if not hasattr(post, '_prefetched_thumbnails'):
+            post._prefetched_thumbnails = {}
+        post._prefetched_thumbnails[variant] = thumbnail
+        if thumbnail is None:
+            misses += 1
+        else:
+            hits += 1
+    _record_prefetch(hits, misses)
+    return hits, misses
+
+
+def _record_prefetch(hits, misses):
+    logger.debug('Миниатюры страницы: найдено %s, нет %s', hits, misses)
+    for name, value in (('hits', hits), ('misses', misses)):
+        if not value:
+            continue
+        key = f'{PREFETCH_STATS_KEY}:{name}'
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.set(key, value, None)
+
+
+def prefetch_stats(reset=False):
+    """Накопленные счётчики попаданий и промахов prefetch.
+
+    Счётчики лежат в общем кеше, поэтому команда thumbnail_stats видит
+    то, что насчитали веб-воркеры.
+    """
+    keys = {name: f'{PREFETCH_STATS_KEY}:{name}'
+            for name in ('hits', 'misses')}
+    values = cache.get_many(list(keys.values()))
+    if reset:
+        cache.delete_many(list(keys.values()))
+    return {name: values.get(key, 0) for name, key in keys.items()}
+
+
+def thumbnail_or_placeholder(image, geometry):
+    """Миниатюра, если она готова; иначе заглушка и постановка в очередь.
+
+    Запрос никогда не ждёт Pillow: пока миниатюры нет, отдаётся
+    settings.THUMBNAIL_PLACEHOLDER или, если он не задан, оригинал.
+    """
+    if not image:
+        return None
+    prefetched = getattr(image.instance, '_prefetched_thumbnails', {})
+    variant = _variant_key(geometry, geometry_options(geometry))
+    if variant in prefetched:
+        thumbnail = prefetched[variant]
+    else:
+        thumbnail = cached_thumbnail(image, geometry)
+    if thumbnail is not None:
+        return thumbnail
+    return _placeholder(image)
+
+
+def _placeholder(image):
+    schedule(image.name)
+    if settings.THUMBNAIL_PLACEHOLDER:
+        return Placeholder(settings.THUMBNAIL_PLACEHOLDER)
+    post = image.instance
+    return Placeholder(image.url, getattr(post, 'image_width', None),
+                       getattr(post, 'image_height', None),
+                       getattr(post, 'image_lqip', ''))
+
+
+def _srcset(thumbnails):
+    widths = {}
+    for thumbnail in thumbnails:
+        if thumbnail is not None:
+            widths.setdefault(thumbnail.width, thumbnail.url)
+    return ', '.join(f'{url} {width}w'
+                     for width, url in sorted(widths.items()))
+
+
+def responsive_image(image, geometry):
+    """Миниатюра geometry со всеми готовыми вариантами для srcset.
+
+    Все варианты ищутся одним пакетным запросом к kvstore, если пост
+    не прошёл через prefetch. Пока основной миниатюры нет, отдаётся
+    заглушка, как в thumbnail_or_placeholder.
+    """
+    if not image:
+        return None
+    post = image.instance
+    if not hasattr(post, '_prefetched_thumbnails'):
+        prefetch([post])
+    prefetched = post._prefetched_thumbnails
+    thumbnail = prefetched.get(
+        _variant_key(geometry, geometry_options(geometry)))
+    if thumbnail is None:
+        return _placeholder(image)
+    by_format = {}
+    for variant_geometry, options in srcset_variants():
+        by_format.setdefault(options['format'], []).append(
+            prefetched[_variant_key(variant_geometry, options)])
+    if None in sum(by_format.values(), []):
+        # Часть вариантов ещё не создана (например, после смены настроек).
+        schedule(image.name)
+    sources = []
+    for image_format in image_formats():
+        srcset = _srcset(by_format[image_format])
+        if srcset:
+            sources.append((f'image/{image_format.lower()}', srcset))
+    return ResponsiveImage(thumbnail, _srcset(by_format['JPEG']), sources,
+                           post.image_lqip)
+
+
+def _pending_key(name):
+    return f'thumbnails:pending:{name}'
+
+
+def source_file(name):
+    """Картинка поста по имени файла в хранилище поля Post.image.
+
+    Имя миниатюры sorl зависит и от хранилища исходника, поэтому оно
+    должно совпадать с тем, через которое шаблоны видят картинку.
+    """
+    from .models import Post
+
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def generate(name):
+    """Создаёт все настроенные миниатюры файла name.
+
+    Картинка декодируется один раз в песочнице (images.render), а
+    запись файлов и kvstore остаются в текущем процессе. Возвращает
+    True, если хотя бы одна миниатюра была создана заново.
+    """
+    source = source_file(name)
+    if not source.exists():
+        return False
+    missing = []
+    for geometry, options in variants():
+        options = backend.normalize_options(source, options)
+        thumbnail = backend.thumbnail_file(source, geometry, **options)
+        if default.kvstore.get(thumbnail):
+            continue
+        if thumbnail.exists():
+            # Файл уже есть (например, kvstore очищен): как и sorl,
+            # не перезаписываем его, а только регистрируем.
+            default.kvstore.get_or_set(source)
+            default.kvstore.set(thumbnail, source)
+            continue
+        missing.append((geometry, options, thumbnail))
+    if not missing:
+        return False
+    with source.storage.open(name, 'rb') as file:
+        content = file.read()
+    size, rendered = images.render(
+        content, [(geometry, options) for geometry, options, _ in missing])
+    source.set_size(size)
+    for (_, _, thumbnail), (data, thumbnail_size) in zip(missing, rendered):
+        thumbnail.write(data)
+        thumbnail.set_size(thumbnail_size)
+        default.kvstore.get_or_set(source)
+        default.kvstore.set(thumbnail, source)
+    return True
+
+
+def _refresh_posts(name):
+    # Карточки и страницы с постами отрисованы с заглушкой: меняем
+    # отметку изменения и сбрасываем кеши, чтобы показать миниатюру.
+    from . import caching
+    from .models import Post
+
+    posts = list(Post.objects.filter(image=name).only(
+        'pk', 'author_id', 'group_id'))
+    if not posts:
+        return
+    Post.objects.filter(pk__in=[post.pk for post in posts]).update(
+        updated=timezone.now())
+    caching.bump_feed_generation()
+    for post in posts:
+        caching.purge_tags('index', *caching.post_tags(post))
+
+
+def run(name):
+    """Создаёт миниатюры файла и обновляет закешированные страницы."""
+    try:
+        if generate(name):
+            _refresh_posts(name)
+        return True
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+        return False
+    finally:
+        cache.delete(_pending_key(name))
+
+
+def process(name):
+    """Задача воркера: миниатюры для одного файла.
+
+    Поток воркера только ждёт песочницу: декодирование и сжатие идут
+    в её процессах с лимитами памяти и времени.
+    """
+    try:
+        return run(name)
+    finally:
+        # Воркер живёт в своём потоке со своим соединением с БД.
+        connection.close()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    return _executor
+
+
+def schedule(name):
+    """Ставит создание миниатюр в очередь после фиксации транзакции."""
+    if not name or not cache.add(_pending_key(name), True,
+                                 settings.THUMBNAIL_PENDING_TIMEOUT):
+        return
+    if settings.THUMBNAIL_ASYNC:
+        transaction.on_commit(lambda: get_executor().submit(process, name))
+    else:
+        transaction.on_commit(lambda: run(name))
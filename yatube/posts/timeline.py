@@ -0,0 +1,228 @@
+import heapq
+from collections import defaultdict
+from itertools import chain
+
+from django.conf import settings
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .utils import (CURSOR_PARAM, NEXT, POSTS_PER_PAGE, CursorPaginator,
+                    decode_cursor, paginate)
+
+
+def is_pull_author(author_id):
+    """Посты автора с большим числом подписчиков не раскладываются."""
+    return UserStats.objects.filter(
+        pk=author_id, timeline_pull=True).exists()
+
+
+def pull_author_ids(user):
+    """pull-авторы, на которых подписан пользователь."""
+    return list(Follow.objects.filter(
+        user=user, author__stats__timeline_pull=True,
+    ).values_list('author_id', flat=True))
+
+
+def update_mode(author_id):
+    """Переводит автора в pull-режим после роста числа подписчиков.
+
+    В pull-режим автор переходит с TIMELINE_PULL_THRESHOLD подписчиков.
+    Обратный переход требует дозаполнить ленты подписчиков, поэтому его
+    выполняет не запрос, а команда backfill_timelines --push (см.
+    push_authors).
+    """
+    update_modes([author_id])
+
+
+def update_modes(author_ids):
+    """update_mode для пачки авторов одним запросом."""
+    UserStats.objects.filter(
+        pk__in=author_ids, timeline_pull=False,
+        followers_count__gte=settings.TIMELINE_PULL_THRESHOLD).update(
+        timeline_pull=True)
+
+
+def push_authors():
+    """Возвращает на раскладку pull-авторов с малым числом подписчиков.
+
+    Переключаются авторы, у которых подписчиков меньше
+    TIMELINE_PUSH_THRESHOLD; возвращается их число. Посты, написанные в
+    pull-режиме, и подписки, оформленные в нём, не попали в ленты,
+    поэтому ленты подписчиков дозаполняются последними
+    TIMELINE_BACKFILL_POSTS постами автора.
+    """
+    candidates = UserStats.objects.filter(
+        timeline_pull=True,
+        followers_count__lt=settings.TIMELINE_PUSH_THRESHOLD)
+    pushed = 0
+    for author_id in candidates.values_list('pk', flat=True):
+        # Сначала режим: посты, написанные после переключения, разложит
+        # fan_out_posts, а более ранние прочитает дозаполнение.
+        if not candidates.filter(pk=author_id).update(timeline_pull=False):
+            continue
+        _fill_timelines({author_id: Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)},
+            recent=settings.TIMELINE_BACKFILL_POSTS)
+        pushed += 1
+    return pushed
+
+
+def _fill_timelines(followers, recent=None):
+    """Раскладывает посты авторов в ленты их подписчиков.
+
+    followers - {id автора: id подписчиков}. Без recent посты всех
+    авторов читаются одним запросом, иначе - последние recent постов
+    каждого автора. Записи ленты вставляются пачками около
+    TIMELINE_BATCH_SIZE строк.
+    """
+    followers = {author_id: list(user_ids)
+                 for author_id, user_ids in followers.items() if user_ids}
+    if not followers:
+        return
+    rows = Post.objects.only('id', 'author_id', 'pub_date')
+    if recent is None:
+        posts = rows.filter(author_id__in=followers).iterator()
+    else:
+        posts = chain.from_iterable(
+            rows.filter(author_id=author_id).order_by(
+                '-pub_date', '-id')[:recent]
+            for author_id in followers)
+    batch = []
+    for post in posts:
+        batch += _entries(followers[post.author_id], [post])
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _entries(user_ids, posts):
+    return [
+        TimelineEntry(user_id=user_id, post_id=post.id,
+                      author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in user_ids
+        for post in posts
+    ]
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts):
+    """Раскладывает новые посты одного автора в ленты подписчиков.
+
+    Подписчики читаются один раз на всю пачку постов.
+    """
+    if not posts or is_pull_author(posts[0].author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=posts[0].author_id).values_list('user_id', flat=True)
+    # Пачка записей ленты - около TIMELINE_BATCH_SIZE строк.
+    users_per_batch = max(1, settings.TIMELINE_BATCH_SIZE // len(posts))
+    batch = []
+    for user_id in follower_ids.iterator():
+        batch.append(user_id)
+        if len(batch) >= users_per_batch:
+            TimelineEntry.objects.bulk_create(
+                _entries(batch, posts), ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(
+            _entries(batch, posts), ignore_conflicts=True)
+
+
+def add_author(user_id, author_id):
+    """Добавляет в ленту пользователя посты автора после подписки."""
+    if not is_pull_author(author_id):
+        _fill_timelines({author_id: [user_id]})
+
+
+def add_follows(follows):
+    """Обновляет режимы авторов и ленты после пачки новых подписок.
+
+    Подписки группируются по автору: режимы и pull-авторы проверяются
+    одним запросом на пачку, посты всех авторов читаются один раз.
+    """
+    followers = defaultdict(list)
+    for follow in follows:
+        followers[follow.author_id].append(follow.user_id)
+    update_modes(list(followers))
+    pull_ids = set(UserStats.objects.filter(
+        pk__in=list(followers), timeline_pull=True).values_list(
+        'pk', flat=True))
+    _fill_timelines({author_id: user_ids
+                     for author_id, user_ids in followers.items()
+                     if author_id not in pull_ids})
+
+
+def remove_author(user_id, author_id):
+    """Убирает посты автора из ленты пользователя после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id).delete()
+
+
+def _post_key(post):
+    return post.pub_date, post.id
+
+
+def merged_page(user, pull_ids, cursor, per_page=POSTS_PER_PAGE):
+    """Страница ленты: личная лента, слитая с постами pull-авторов.
+
+    Оба источника читаются одним диапазоном по индексу от позиции
+    курсора, поэтому стоимость страницы не зависит ни от числа
+    подписчиков у авторов, ни от глубины страницы.
+    """
+    position = decode_cursor(cursor)
+    pushed = CursorPaginator(
+        TimelineEntry.objects.filter(user=user).select_related(
+            'post__author', 'post__group'),
+        per_page, key='post_id')
+    pulled = CursorPaginator(
+        Post.objects.filter(author_id__in=pull_ids).select_related(
+            'author', 'group'),
+        per_page)
+    descending = position is None or position[0] == NEXT
+    merged = heapq.merge(
+        [entry.post for entry in pushed.window(position)],
+        pulled.window(position),
+        key=_post_key, reverse=descending)
+    rows, seen = [], set()
+    for post in merged:
+        if post.id not in seen:
+            seen.add(post.id)
+            rows.append(post)
+        if len(rows) > per_page:
+            break
+    return pulled.page_from_window(rows, position)
+
+
+def follow_cursor_page(user, cursor, per_page=POSTS_PER_PAGE):
+    """Курсорная страница ленты подписок: посты, а не записи ленты."""
+    pull_ids = pull_author_ids(user)
+    if pull_ids:
+        return merged_page(user, pull_ids, cursor, per_page)
+    page_obj = CursorPaginator(
+        TimelineEntry.objects.filter(user=user).select_related(
+            'post__author', 'post__group'),
+        per_page, key='post_id').get_page(cursor)
+    page_obj.object_list = [entry.post for entry in page_obj]
+    return page_obj
+
+
+def follow_page(request, per_page=POSTS_PER_PAGE):
+    """Страница ленты подписок текущего пользователя.
+
+    Если пользователь подписан на pull-авторов, лента всегда отдаётся в
+    курсорном режиме: слияние двух источников по смещению потребовало бы
+    читать все предыдущие страницы.
+    """
+    pull_ids = pull_author_ids(request.user)
+    if pull_ids:
+        return merged_page(request.user, pull_ids,
+                           request.GET.get(CURSOR_PARAM), per_page)
+    entries = TimelineEntry.objects.filter(
+        user=request.user).select_related('post__author', 'post__group')
+    return paginate(request, entries, per_page,
+                    transform=lambda entry: entry.post, key='post_id')
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import feeds, views
 
 app_name = 'posts'
 
@@ -8,12 +8,18 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group_post'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('feed/<str:kind>/', feeds.index, name='index_feed'),
+    path('group/<slug:slug>/feed/<str:kind>/', feeds.group_posts,
+         name='group_feed'),
+    path('profile/<str:username>/feed/<str:kind>/', feeds.profile,
+         name='profile_feed'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/', views.add_comment,
          name='add_comment'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
     path(
         'profile/<str:username>/follow/',
         views.profile_follow,
@@ -0,0 +1,170 @@
+import base64
+import binascii
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+CURSOR_PARAM = 'cursor'
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def _value(obj, name):
+    # Строки .values() - словари, остальное - объекты моделей.
+    if isinstance(obj, dict):
+        return obj[name]
+    return getattr(obj, name)
+
+
+def encode_cursor(obj, direction, field='pub_date', key='pk'):
+    """Кодирует позицию (дата, id) объекта в строку для URL."""
+    raw = (f'{direction}|{_value(obj, field).isoformat()}'
+           f'|{_value(obj, key)}')
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Разбирает курсор; для битого курсора возвращает None."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, stamp, pk = raw.split('|')
+        value = parse_datetime(stamp)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or value is None:
+        return None
+    return direction, value, pk
+
+
+class CursorPage(Sequence):
+    """Страница ленты без номера и общего количества записей."""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        # Курсоры считаются сразу, чтобы object_list можно было заменить
+        # (например, записи ленты подписок на сами посты).
+        self.next_cursor = None
+        self.previous_cursor = None
+        if object_list and has_next:
+            self.next_cursor = paginator.make_cursor(object_list[-1], NEXT)
+        if object_list and has_previous:
+            self.previous_cursor = paginator.make_cursor(
+                object_list[0], PREVIOUS)
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class CursorPaginator:
+    """Keyset-пагинация по паре (field, key).
+
+    В отличие от Paginator не выполняет COUNT(*) и OFFSET: каждая
+    страница - это диапазонное чтение по индексу, поэтому глубокие
+    страницы открываются так же быстро, как первая. По умолчанию
+    объекты идут от новых к старым, descending=False разворачивает ленту.
+    """
+
+    def __init__(self, object_list, per_page, field='pub_date', key='pk',
+                 descending=True):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.field = field
+        self.key = key
+        self.descending = descending
+
+    def make_cursor(self, obj, direction):
+        return encode_cursor(obj, direction, self.field, self.key)
+
+    def window(self, position):
+        """Следующие per_page + 1 объектов после позиции курсора.
+
+        Объекты идут в порядке обхода: в порядке ленты для NEXT и в
+        обратном для PREVIOUS.
+        """
+        queryset = self.object_list
+        direction = NEXT if position is None else position[0]
+        lookup = 'lt' if (direction == NEXT) == self.descending else 'gt'
+        if position is not None:
+            _, value, key = position
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value})
+                | Q(**{self.field: value, f'{self.key}__{lookup}': key}))
+        if lookup == 'lt':
+            ordering = (f'-{self.field}', f'-{self.key}')
+        else:
+            ordering = (self.field, self.key)
+        return list(queryset.order_by(*ordering)[:self.per_page + 1])
+
+    def page_from_window(self, rows, position):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if position is None or position[0] == NEXT:
+            return CursorPage(rows, self, has_more, position is not None)
+        rows.reverse()
+        return CursorPage(rows, self, True, has_more)
+
+    def get_page(self, cursor):
+        position = decode_cursor(cursor)
+        return self.page_from_window(self.window(position), position)
+
+
+def cursor_mode(request):
+    return (settings.POSTS_PAGINATION == 'cursor'
+            or CURSOR_PARAM in request.GET)
+
+
+def paginate(request, queryset, per_page=POSTS_PER_PAGE, transform=None,
+             key='pk'):
+    """Возвращает страницу ленты в режиме, выбранном для запроса.
+
+    По умолчанию используется постраничный Paginator (?page=N). Курсорный
+    режим включается настройкой POSTS_PAGINATION = 'cursor' или наличием
+    параметра ?cursor= в запросе. key - поле для разрешения равенства
+    дат в курсоре; transform применяется к объектам страницы уже после
+    вычисления курсоров.
+    """
+    if cursor_mode(request):
+        paginator = CursorPaginator(queryset, per_page, key=key)
+        page_obj = paginator.get_page(request.GET.get(CURSOR_PARAM))
+    else:
+        paginator = Paginator(queryset, per_page)
+        page_obj = paginator.get_page(request.GET.get('page'))
+    if transform is not None:
+        page_obj.object_list = [transform(obj) for obj in page_obj]
+    return page_obj
+
+
+def paginate_comments(request, queryset, per_page=COMMENTS_PER_PAGE):
+    """Курсорная страница комментариев, ?comments=newest - сначала новые."""
+    newest = request.GET.get('comments') == 'newest'
+    paginator = CursorPaginator(queryset, per_page, field='created',
+                                descending=newest)
+    return paginator.get_page(request.GET.get('comments_cursor'))
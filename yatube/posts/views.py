@@ -1,32 +1,42 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect
 
 from posts.forms import PostForm, CommentForm
 
+from . import caching, conditional, timeline
 from .models import Post, Group, User, Comment, Follow
-
-POSTS_PER_PAGE = 10
+from .caching import cache_anonymous
+from .conditional import conditional_page
+from .search import SearchResults
+from .utils import POSTS_PER_PAGE, paginate, paginate_comments
 
 
+@cache_anonymous
+@conditional_page(conditional.index_scope)
 def index(request):
+    caching.tag_page(request, ['index'])
+    generation = caching.feed_generation()
     posts = Post.objects.select_related('author', 'group').all()
-    paginator = Paginator(posts, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, posts)
     context = {
         'page_obj': page_obj,
+        'feed_cache_key': caching.feed_cache_key(
+            'index', request, page_obj, generation),
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
 
     return render(request, 'posts/index.html', context)
 
 
+@cache_anonymous
+@conditional_page(conditional.group_scope)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
+    caching.tag_page(request, [f'group:{group.pk}'])
     posts = group.posts.select_related('author')
-    paginator = Paginator(posts, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, posts)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -35,12 +45,14 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_anonymous
+@conditional_page(conditional.profile_scope)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
+    user = get_object_or_404(User.objects.select_related('stats'),
+                             username=username)
+    caching.tag_page(request, [f'author:{user.pk}'])
     posts = user.posts.select_related('group')
-    paginator = Paginator(posts, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, posts)
     following = (
         request.user.is_authenticated
         and user.following.filter(user=request.user).exists())
@@ -52,19 +64,49 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@cache_anonymous
+@conditional_page(conditional.post_scope)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id)
+    caching.tag_page(request, caching.post_tags(post))
     form = CommentForm(request.POST or None)
-    comments = Comment.objects.select_related('post').filter(post=post)
+    comments = paginate_comments(
+        request, Comment.objects.select_related('author').filter(post=post))
     context = {
         'post': post,
         'profile': post.author,
         'form': form,
         'comments': comments,
+        'comments_newest': request.GET.get('comments') == 'newest',
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    group = author = None
+    if request.GET.get('group'):
+        group = get_object_or_404(Group, slug=request.GET['group'])
+    if request.GET.get('author'):
+        author = get_object_or_404(User, username=request.GET['author'])
+    results = SearchResults(query,
+                            group_id=group and group.pk,
+                            author_id=author and author.pk)
+    paginator = Paginator(results, POSTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    params = request.GET.copy()
+    params.pop('page', None)
+    context = {
+        'query': query,
+        'group': group,
+        'author': author,
+        'page_obj': page_obj,
+        'page_query': params.urlencode() + '&' if params else '',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None)
@@ -107,10 +149,7 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = timeline.follow_page(request)
     context = {
         'page_obj': page_obj,
     }
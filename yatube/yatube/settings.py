@@ -1,4 +1,10 @@
+import atexit
 import os
+import shutil
+import sys
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -39,6 +45,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -47,6 +54,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Сжатие ответов (core.middleware.CompressionMiddleware): уровни
+# gzip (1-9) и brotli (0-11) - баланс между трафиком и CPU воркеров
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+# Ответы короче этого числа байт не сжимаются
+COMPRESSION_MIN_LENGTH = 500
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
@@ -120,6 +134,11 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+# Вне DEBUG collectstatic добавляет в имена хеш содержимого и пишет
+# рядом сжатые копии (.gz и .br), которые отдаёт core.media.serve_static
+if not DEBUG:
+    STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -135,11 +154,113 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+# Кто отдаёт байты медиафайлов: None - само приложение (FileResponse),
+# 'nginx' - X-Accel-Redirect на internal-локацию MEDIA_ACCEL_PREFIX,
+# 'sendfile' - X-Sendfile (Apache mod_xsendfile, lighttpd)
+MEDIA_ACCEL = os.getenv('MEDIA_ACCEL') or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# Время кеширования медиафайлов без хеша в имени
+MEDIA_CACHE_MAX_AGE = 60 * 60
+
+# Миниатюры картинок постов: размер -> опции sorl-thumbnail.
+# Создаются пулом потоков после сохранения поста, а не при рендере
+POST_THUMBNAILS = {
+    '960x339': {'crop': 'center', 'upscale': True},
 }
+# Адаптивные варианты картинки для srcset: ширины с пропорциями
+# POST_IMAGE_RATIO и современные форматы (используются те, что умеет
+# установленный Pillow), плюс JPEG для остальных браузеров
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+POST_IMAGE_RATIO = (960, 339)
+POST_IMAGE_FORMATS = ('AVIF', 'WEBP')
+POST_IMAGE_SIZES = '(min-width: 992px) 960px, 100vw'
+# Проверка и декодирование загруженных картинок идут в пуле процессов
+# с лимитами (0 процессов - в веб-процессе, только с лимитом времени)
+SANDBOX_WORKERS = 2
+SANDBOX_TIMEOUT = 10
+SANDBOX_MEMORY_LIMIT = 512 * 1024 * 1024
+# Картинки больше этого числа пикселей отклоняются по заголовку
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+THUMBNAIL_ASYNC = True
+THUMBNAIL_WORKERS = 2
+# Миниатюры одной картинки создаются в песочнице за один проход;
+# лимит времени на все варианты
+THUMBNAIL_TIMEOUT = 60
+# Что показывать, пока миниатюра не готова (None - оригинал картинки)
+THUMBNAIL_PLACEHOLDER = None
+# Сколько секунд не ставить повторно в очередь один и тот же файл
+THUMBNAIL_PENDING_TIMEOUT = 60 * 5
+
+# Кеш должен быть общим для всех процессов: версии тегов страниц,
+# поколение лент и счётчики миниатюр меняются и в веб-воркерах, и в
+# командах manage.py, а сброс в одном процессе должен быть виден всем
+# остальным. Локальный LocMemCache для этого не подходит.
+# Для разработки по умолчанию используется файловый кеш (общий для
+# процессов одного сервера). Каждая запись в нём перебирает каталог
+# кеша, поэтому в продакшене (DEBUG = False) обязателен Memcached (или
+# Redis через django-redis), например:
+# CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache
+# CACHE_LOCATION=127.0.0.1:11211
+if not DEBUG and 'CACHE_BACKEND' not in os.environ:
+    raise ImproperlyConfigured(
+        'Задайте CACHE_BACKEND: Memcached или Redis, общий для всех процессов')
+if 'CACHE_BACKEND' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': os.environ['CACHE_BACKEND'],
+            'LOCATION': os.getenv('CACHE_LOCATION'),
+        }
+    }
+else:
+    # Тесты очищают кеш: у каждого прогона свой каталог, чтобы не
+    # стирать кеш сервера разработки и не мешать параллельным прогонам.
+    # Каталог передаётся через окружение процессам, запущенным из тестов.
+    if 'CACHE_LOCATION' not in os.environ and (
+            sys.argv[1:2] == ['test'] or 'pytest' in sys.modules):
+        os.environ['CACHE_LOCATION'] = tempfile.mkdtemp(
+            prefix='yatube_cache_')
+        atexit.register(shutil.rmtree, os.environ['CACHE_LOCATION'], True)
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv(
+                'CACHE_LOCATION',
+                os.path.join(tempfile.gettempdir(), 'yatube_cache')),
+            'OPTIONS': {
+                # Карточки, страницы, миниатюры sorl (около 7 записей на
+                # картинку), версии тегов: с 300 записями по умолчанию
+                # они постоянно вытесняли бы друг друга.
+                'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 50000)),
+            },
+        }
+    }
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
+# Время жизни фрагментов лент в кеше; актуальность обеспечивает
+# поколение, которое меняется при сохранении и удалении постов и групп
+FEED_CACHE_TIMEOUT = 60 * 60
+# Время жизни отрендеренных карточек постов, общих для всех лент
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# Время жизни страниц, закешированных целиком для анонимных посетителей
+ANONYMOUS_CACHE_TIMEOUT = 60 * 10
+# Число постов в Atom/RSS-фидах и время жизни готового XML в кеше;
+# актуальность обеспечивают версии тегов области фида
+SYNDICATION_ITEMS = 50
+SYNDICATION_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Режим пагинации лент: 'page' (?page=N) или 'cursor' (?cursor=...)
+POSTS_PAGINATION = os.getenv('POSTS_PAGINATION', 'page')
+
+# Размер пачки при раскладке постов по лентам подписчиков
+TIMELINE_BATCH_SIZE = 1000
+# Авторы с таким числом подписчиков и больше не раскладываются по лентам,
+# их посты подмешиваются в ленту подписок при чтении
+TIMELINE_PULL_THRESHOLD = 10000
+# Обратно на раскладку автор переходит, только когда подписчиков стало
+# меньше этого порога: иначе отписки и подписки около границы каждый раз
+# запускали бы заполнение лент всех подписчиков. Переход выполняет
+# команда backfill_timelines --push (например, по cron), а не запрос
+TIMELINE_PUSH_THRESHOLD = 9000
+# Сколько последних постов автора дозаполняется в ленты при переходе
+TIMELINE_BACKFILL_POSTS = 100